@@ -0,0 +1,118 @@
+"""
+Throughput of the node API under concurrent pollers.
+
+Serves `cli_flask.build_app` with a threaded werkzeug server on localhost and
+polls GET /status from `--pollers` threads for `--seconds`, while the status
+changes every `--update` seconds as the node agent does. It compares the body
+cached per status version against serializing the status on each request (as
+before the cache), and reports requests per second and latency. With `--etag`
+the pollers send If-None-Match and mostly get 304.
+
+Usage:
+    python benchmarks/bench_node_api.py [--pollers 16] [--seconds 5] [--gpus 8] [--etag]
+"""
+import json
+import time
+import logging
+import argparse
+import statistics
+import http.client
+from threading import Thread, Event
+from unittest import mock
+
+from common import setup_path
+setup_path()
+
+from werkzeug.serving import make_server
+
+from next_cluster.client import client_daemon, cli_flask
+from next_cluster.utils.records import GPU_STAT, GPU_PROC
+
+def build_node(n_gpus: int, n_procs: int) -> client_daemon.NodeStat:
+    with mock.patch.object(client_daemon, 'get_gpu_serial', return_value = {}):
+        node = client_daemon.NodeStat(extra_keys = [])
+    node._set_gpus([GPU_STAT(i, 'NVIDIA GeForce RTX 3090', 1000 * i, 24576, 50, 60)
+                    for i in range(n_gpus)])
+    set_procs(node, n_gpus, n_procs, 0)
+    return node
+
+def set_procs(node, n_gpus: int, n_procs: int, tick: int):
+    node._set_procs({i: [GPU_PROC(1000 * i + p, f'user{(i + p + tick) % 40}', 2048,
+                                  'python train.py --config configs/exp.yaml ' * 10)
+                         for p in range(n_procs)]
+                     for i in range(n_gpus)})
+
+def poller(port: int, stop: Event, etag: bool, latencies: list, codes: list):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    tag = None
+    while not stop.is_set():
+        headers = {'X-Auth-Token': 'pw'}
+        if etag and tag is not None:
+            headers['If-None-Match'] = tag
+        start = time.perf_counter()
+        conn.request('GET', '/status', headers = headers)
+        resp = conn.getresponse()
+        resp.read()
+        latencies.append(time.perf_counter() - start)
+        codes.append(resp.status)
+        tag = resp.getheader('ETag', tag)
+    conn.close()
+
+def run(node, args, cached: bool):
+    if not cached:
+        # the old path: serialize on every request
+        node.status_json = lambda: (node.version, 
+                                    json.dumps(node.status, ensure_ascii = False).encode('utf-8'))
+    else:
+        node.__dict__.pop('status_json', None)
+    app = cli_flask.build_app(node, 'pw')
+    server = make_server('127.0.0.1', 0, app, threaded = True)
+    Thread(target = server.serve_forever, daemon = True).start()
+
+    stop = Event()
+    latencies = [[] for _ in range(args.pollers)]
+    codes = [[] for _ in range(args.pollers)]
+    threads = [Thread(target = poller, 
+                      args = (server.server_port, stop, args.etag, latencies[i], codes[i]))
+               for i in range(args.pollers)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    tick = 0
+    while time.perf_counter() - start < args.seconds:
+        time.sleep(args.update)
+        tick += 1
+        set_procs(node, args.gpus, args.procs, tick)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    server.shutdown()
+
+    lat = sorted(x for l in latencies for x in l)
+    codes = [c for l in codes for c in l]
+    return {'requests_per_second': len(lat) / wall,
+            'p50_ms': statistics.median(lat) * 1000,
+            'p99_ms': lat[int(len(lat) * 0.99)] * 1000,
+            'not_modified': codes.count(304) / len(codes)}
+
+def main():
+    # no access log per request
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pollers', type = int, default = 16)
+    parser.add_argument('--seconds', type = float, default = 5)
+    parser.add_argument('--update', type = float, default = 1, 
+                        help = 'seconds between status changes')
+    parser.add_argument('--gpus', type = int, default = 8)
+    parser.add_argument('--procs', type = int, default = 2, help = 'processes per gpu')
+    parser.add_argument('--etag', action = 'store_true', help = 'send If-None-Match')
+    args = parser.parse_args()
+    node = build_node(args.gpus, args.procs)
+    result = {'body_bytes': len(node.status_json()[1]),
+              'per_request': run(node, args, cached = False),
+              'cached': run(node, args, cached = True)}
+    print(json.dumps(result, indent = 4))
+
+if __name__ == '__main__':
+    main()
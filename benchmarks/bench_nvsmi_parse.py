@@ -0,0 +1,60 @@
+"""
+Parsing of `nvidia-smi --query-compute-apps=gpu_serial,pid,used_memory` output.
+
+Times `parse_compute_apps` (streaming, format csv,noheader,nounits) against
+the old pandas pipeline (format csv with header and units). The input is 
+either synthetic or a recorded output, e.g.,
+    nvidia-smi --query-compute-apps=gpu_serial,pid,used_memory --format=csv,noheader,nounits > out.csv
+
+Usage:
+    python benchmarks/bench_nvsmi_parse.py [--rows 16] [--file out.csv]
+"""
+import io
+import json
+import argparse
+
+from common import setup_path, timeit
+setup_path()
+
+from next_cluster.utils.gpu_status import parse_compute_apps
+
+def synthetic(n_rows: int, n_gpus: int = 8):
+    serials = [f'13240210{i:05d}' for i in range(n_gpus)]
+    lines = [f'{serials[i % n_gpus]}, {10000 + i}, {1000 + i}' for i in range(n_rows)]
+    return lines, {s: i for i, s in enumerate(serials)}
+
+def pandas_parse(text: str, serial_map):
+    """Reference: the old pipeline on output with header and units"""
+    import pandas as pd
+    df = pd.read_csv(io.StringIO(text), dtype = str)
+    df.rename(lambda k: k.strip(), axis = 'columns', inplace = True)
+    df['pid'] = df['pid'].astype(int)
+    df['idx'] = df['gpu_serial'].apply(lambda k: serial_map[k])
+    df['mem(MiB)'] = df['used_gpu_memory [MiB]'].apply(lambda k: int(k.split()[0]))
+    return df.groupby('idx')[['pid', 'mem(MiB)']].apply(
+        lambda k: k.to_dict('records')).to_dict()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 16)
+    parser.add_argument('--file', help = 'recorded output with noheader,nounits')
+    args = parser.parse_args()
+
+    if args.file:
+        lines = open(args.file).read().splitlines()
+        serials = sorted({line.split(',')[0].strip() for line in lines if line.strip()})
+        serial_map = {s: i for i, s in enumerate(serials)}
+    else:
+        lines, serial_map = synthetic(args.rows)
+    # the same rows in the old format
+    text = 'gpu_serial, pid, used_gpu_memory [MiB]\n' + ''.join(
+        '{}, {}, {} MiB\n'.format(*[k.strip() for k in line.split(',')]) for line in lines)
+
+    number = max(1, 20000 // max(len(lines), 1))
+    stream = timeit(lambda: parse_compute_apps(iter(lines), serial_map), number = number)
+    pandas = timeit(lambda: pandas_parse(text, serial_map), number = max(1, number // 100))
+    print(json.dumps({'rows': len(lines), 'stream': stream, 'pandas_reference': pandas},
+                     indent = 4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Memory of the node status held by the main node.
+
+Builds the status of `--nodes` nodes with 8 gpus each as parsed JSON dicts
+and as `GPU_STAT`/`GPU_PROC` records, and reports the memory allocated
+(tracemalloc) and the growth of RSS.
+
+Usage:
+    python benchmarks/bench_records.py [--nodes 500] [--procs 2]
+"""
+import gc
+import json
+import argparse
+import resource
+import tracemalloc
+
+from common import setup_path
+setup_path()
+
+from next_cluster.utils.records import GPU_STAT
+
+def node_json(n: int, n_procs: int) -> str:
+    """JSON of a node as sent by the node agent"""
+    gpus = [{'index': i, 'name': 'NVIDIA GeForce RTX 3090', 'use_mem': 1000 * i,
+             'tot_mem': 24576, 'utilize': 50, 'temp': 60,
+             'users': [{'pid': 1000 * i + p, 'username': f'user{(n + p) % 40}',
+                        'mem(MiB)': 2048,
+                        'command': 'python train.py --config configs/exp.yaml ' * 10}
+                       for p in range(n_procs)]}
+            for i in range(8)]
+    return json.dumps({'hostname': f'node{n}', 'gpus': gpus})
+
+def build(n_nodes: int, n_procs: int, records: bool):
+    nodes = []
+    for n in range(n_nodes):
+        node = json.loads(node_json(n, n_procs))
+        if records:
+            node['gpus'] = [GPU_STAT.from_dict(g) for g in node['gpus']]
+        nodes.append(node)
+    return nodes
+
+def measure(n_nodes: int, n_procs: int, records: bool):
+    gc.collect()
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    nodes = build(n_nodes, n_procs, records)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    del nodes
+    return {'allocated_mib': current / 2 ** 20,
+            'max_rss_growth_mib': (rss1 - rss0) / 1024}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type = int, default = 500)
+    parser.add_argument('--procs', type = int, default = 2, help = 'processes per gpu')
+    args = parser.parse_args()
+    # records first, as max RSS only grows
+    result = {'records': measure(args.nodes, args.procs, True),
+              'dicts': measure(args.nodes, args.procs, False)}
+    print(json.dumps(result, indent = 4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Startup cost of the node agent.
+
+Each run imports the node agent (`next_cluster.client.cli_flask`) in a fresh
+interpreter and reports the import time, the max RSS and whether pandas was
+loaded. The same is measured with pandas imported as well, as a reference.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5]
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+from common import ROOT
+
+CODE = '''
+import sys, time, types, json, resource
+sys.path.insert(0, {root!r})
+try:
+    import pynvml
+except ImportError:
+    sys.modules['pynvml'] = types.ModuleType('pynvml')
+start = time.perf_counter()
+import next_cluster.client.cli_flask
+{extra}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds,
+                  'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'pandas_loaded': 'pandas' in sys.modules}}))
+'''
+
+def measure(extra: str, repeat: int):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', CODE.format(root = str(ROOT), extra = extra)],
+                             capture_output = True, text = True, check = True, cwd = ROOT)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {'seconds': statistics.median(r['seconds'] for r in runs),
+            'max_rss_mib': statistics.median(r['max_rss_mib'] for r in runs),
+            'pandas_loaded': runs[0]['pandas_loaded']}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+    result = {'node_agent': measure('', args.repeat),
+              'node_agent_with_pandas': measure('import pandas', args.repeat)}
+    print(json.dumps(result, indent = 4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Cost of evaluating user codes of gpu processes on each status refresh.
+
+Builds a cluster with `--nodes` nodes x 8 gpus x `--procs` processes and
+`--bookings` bookings today, then times `Cluster.update_user_code`:
+    - refresh: bookings unchanged, the day-0 user map is reused
+    - rebuild: bookings changed, the map is rebuilt first
+The old approach, which scans the day-0 bookings for each gpu and matches usernames 
+as substrings of the concatenated titles and who, is timed as a reference.
+
+Usage:
+    python benchmarks/bench_user_code.py [--nodes 100] [--procs 4] [--bookings 2000]
+"""
+import json
+import random
+import argparse
+import datetime
+import tempfile
+from pathlib import Path
+
+from common import setup_path, timeit
+setup_path()
+
+from next_cluster.utils.teamup import Booking, local_today
+from next_cluster.main.main_daemon import Cluster
+
+def build(n_nodes: int, n_procs: int, n_bookings: int) -> Cluster:
+    rng = random.Random(0)
+    users = [f'user{i}' for i in range(200)]
+    with tempfile.TemporaryDirectory() as tmp:
+        user_list = Path(tmp) / 'users.txt'
+        user_list.write_text('\n'.join(users))
+        cluster = Cluster([{'nickname': f'node{n}', 'ip': ''} for n in range(n_nodes)],
+                          add_calendar = False, user_list = str(user_list),
+                          run_daemon = False)
+    today = local_today().date()
+    cluster.apply_bookings('cal', [
+        Booking(rng.choice(users), ' '.join(rng.sample(users, 2)),
+                f'node{rng.randrange(n_nodes)}', rng.randrange(8),
+                today, today + datetime.timedelta(days = rng.randint(1, 3)))
+        for _ in range(n_bookings)])
+    for n in range(n_nodes):
+        gpus = [{'index': i, 'name': 'RTX', 'use_mem': 1, 'tot_mem': 2, 'utilize': 3,
+                 'temp': 4, 'users': [{'pid': p, 'username': rng.choice(users),
+                                       'mem(MiB)': 5, 'command': ''}
+                                      for p in range(n_procs)]}
+                for i in range(8)]
+        cluster.apply_node_data({'nickname': f'node{n}'},
+                                {'hostname': f'node{n}', 'last_update': '', 'gpus': gpus})
+    return cluster
+
+def substring_codes(cluster: Cluster):
+    """Reference: the old per-gpu scan over all bookings with substring matching"""
+    rows = [r for r in cluster.bookings.rows() if r['day'] == 0 and r['code'] == 0]
+    for host, node in cluster.nodes.items():
+        for gpu in node['gpus']:
+            bname = ' '.join(r['title'] + r['who'] for r in rows
+                             if r['hostname'] == host and r['index'] == gpu['index'])
+            for proc in gpu['users']:
+                proc['user_code'] = int(proc['username'] not in bname)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type = int, default = 100)
+    parser.add_argument('--procs', type = int, default = 4, help = 'processes per gpu')
+    parser.add_argument('--bookings', type = int, default = 2000)
+    args = parser.parse_args()
+    cluster = build(args.nodes, args.procs, args.bookings)
+
+    def rebuild():
+        cluster._day0_version = None
+        cluster.update_user_code()
+
+    result = {'refresh': timeit(cluster.update_user_code, number = 20),
+              'rebuild': timeit(rebuild, number = 5),
+              'substring_reference': timeit(lambda: substring_codes(cluster), number = 1)}
+    print(json.dumps(result, indent = 4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+Helpers shared by the benchmarks.
+
+Run the benchmarks from the repo root, e.g., `python benchmarks/bench_startup.py`.
+They do not need gpus. NVML is never called, so if pynvml is not installed,
+an empty module takes its place for the imports to succeed.
+"""
+import sys
+import time
+import types
+from pathlib import Path
+from typing import Callable, Dict
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def setup_path():
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    try:
+        import pynvml
+    except ImportError:
+        sys.modules['pynvml'] = types.ModuleType('pynvml')
+
+def timeit(func: Callable, repeat: int = 5, number: int = 100) -> Dict[str, float]:
+    """Return the best and median seconds per call"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    times.sort()
+    return {'best': times[0], 'median': times[len(times) // 2]}
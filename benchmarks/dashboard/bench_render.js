@@ -0,0 +1,115 @@
+// Render time and DOM writes of the dashboard in a fake DOM (fake_dom.js).
+//
+// Loads web/script.js (or the script given as argument, e.g. an older
+// version from git) and feeds it a cluster status of --nodes nodes with
+// --gpus gpus each: the first render, then --updates refreshes where the
+// utilization of --changed of the gpus changes, then a scroll to the middle
+// of the page.
+//
+// Usage:
+//     node benchmarks/dashboard/bench_render.js [script.js] [--nodes 125] [--gpus 8]
+//     git show <rev>:web/script.js > /tmp/old.js && node benchmarks/dashboard/bench_render.js /tmp/old.js
+
+var fs = require('fs');
+var vm = require('vm');
+var path = require('path');
+
+function parse_args(argv){
+    var args = {script: path.join(__dirname, '..', '..', 'web', 'script.js'),
+                nodes: 125, gpus: 8, updates: 20, changed: 0.1, days: 7};
+    for (var i=0; i<argv.length; i++) {
+        if (argv[i].startsWith('--')) {
+            args[argv[i].slice(2)] = parseFloat(argv[++i]);
+        }
+        else {
+            args.script = argv[i];
+        }
+    }
+    return args;
+}
+
+function make_status(args, rng){
+    var date_list = [];
+    for (var d=0; d<args.days; d++) {
+        date_list.push('2024-01-0' + (d + 1));
+    }
+    var nodes = [];
+    for (var n=0; n<args.nodes; n++) {
+        var gpus = [];
+        for (var g=0; g<args.gpus; g++) {
+            var calendar = [];
+            for (var d=0; d<args.days; d++) {
+                calendar.push(rng() < 0.5 ? [['user' + (n + g) % 40, 'user' + g, 0]] : []);
+            }
+            gpus.push({index: g, use_mem: 1000 * g, tot_mem: 24576, utilize: 50,
+                       users: [{username: 'user' + (n + g) % 40, user_code: (n + g) % 3}],
+                       calendar: calendar});
+        }
+        nodes.push({hostname: 'node' + n, status: true, version: '1.0', gpus: gpus,
+                    ips: [['eth0', '10.0.' + (n >> 8) + '.' + (n & 255)]]});
+    }
+    return {Nodes: nodes, date_list: date_list, calendar_status: true,
+            illegal_users: ['user1', 'user2']};
+}
+
+function random(seed){
+    // deterministic, so that versions see the same updates
+    return function(){
+        seed = (seed * 1103515245 + 12345) % 2147483648;
+        return seed / 2147483648;
+    };
+}
+
+function ms(start){
+    return Number(process.hrtime.bigint() - start) / 1e6;
+}
+
+function main(){
+    var args = parse_args(process.argv.slice(2));
+    var dom = require('./fake_dom.js');
+    var context = vm.createContext({$: dom.$, window: dom.window, document: dom.document,
+                                    console: console});
+    vm.runInContext(fs.readFileSync(args.script, 'utf-8'), context, {filename: args.script});
+
+    var rng = random(1);
+    var status = make_status(args, rng);
+    var result = {script: args.script, nodes: args.nodes, gpus: args.gpus};
+
+    dom.stats.writes = 0;
+    var start = process.hrtime.bigint();
+    context.create_page(JSON.parse(JSON.stringify(status)));
+    result.first_render_ms = ms(start);
+    result.first_render_writes = dom.stats.writes;
+    result.rendered_nodes = dom.count('#content-status .node-line');
+
+    var total_ms = 0;
+    var total_writes = 0;
+    for (var u=0; u<args.updates; u++) {
+        status.Nodes.forEach(function(node){
+            node.gpus.forEach(function(gpu){
+                if (rng() < args.changed) {
+                    gpu.utilize = Math.floor(rng() * 100);
+                }
+            });
+        });
+        dom.stats.writes = 0;
+        start = process.hrtime.bigint();
+        // a fresh object, as parsed from each response
+        context.create_page(JSON.parse(JSON.stringify(status)));
+        total_ms += ms(start);
+        total_writes += dom.stats.writes;
+    }
+    result.update_ms = total_ms / args.updates;
+    result.update_writes = total_writes / args.updates;
+
+    dom.stats.writes = 0;
+    start = process.hrtime.bigint();
+    dom.window.scrollY = 40 * args.nodes * (1 + 0.8 * args.gpus) / 2;
+    dom.dispatch('scroll');
+    result.scroll_ms = ms(start);
+    result.scroll_writes = dom.stats.writes;
+    result.rendered_nodes_after_scroll = dom.count('#content-status .node-line');
+    console.log(JSON.stringify(result, null, 4));
+}
+
+main();
@@ -0,0 +1,323 @@
+// A minimal DOM and the subset of jQuery used by web/script.js, to run the
+// dashboard in node without a browser. Every change of the document is
+// counted in `stats.writes`. Layout is a single column: a node line is
+// 40px plus 32px per gpu line, and an element with a css height has it.
+
+var stats = {writes: 0};
+
+function Element(tag){
+    this.tagName = tag;
+    this.children = [];
+    this.parentNode = null;
+    this.classes = [];
+    this.attrs = {};
+    this.style = {};
+    this.text = '';
+    this.id = '';
+}
+
+Element.prototype.appendChild = function(child){
+    if (child.parentNode) {
+        child.parentNode.removeChild(child);
+    }
+    child.parentNode = this;
+    this.children.push(child);
+    stats.writes++;
+};
+
+Element.prototype.removeChild = function(child){
+    var i = this.children.indexOf(child);
+    if (i >= 0) {
+        this.children.splice(i, 1);
+        child.parentNode = null;
+        stats.writes++;
+    }
+};
+
+Element.prototype.cloneNode = function(){
+    var el = new Element(this.tagName);
+    el.classes = this.classes.slice();
+    el.attrs = Object.assign({}, this.attrs);
+    el.style = Object.assign({}, this.style);
+    el.text = this.text;
+    for (var i=0; i<this.children.length; i++) {
+        var child = this.children[i].cloneNode();
+        child.parentNode = el;
+        el.children.push(child);
+    }
+    return el;
+};
+
+Element.prototype.matches = function(compound){
+    // "#id", ".a.b" or "#id.a"
+    var parts = compound.match(/[#.][^#.]+/g) || [];
+    for (var i=0; i<parts.length; i++) {
+        var name = parts[i].slice(1);
+        if (parts[i][0] == '#' ? this.id != name : this.classes.indexOf(name) < 0) {
+            return false;
+        }
+    }
+    return true;
+};
+
+Element.prototype.descendants = function(out){
+    for (var i=0; i<this.children.length; i++) {
+        out.push(this.children[i]);
+        this.children[i].descendants(out);
+    }
+    return out;
+};
+
+Element.prototype.query = function(selector){
+    var steps = selector.trim().split(/\s+/);
+    var found = [this];
+    for (var s=0; s<steps.length; s++) {
+        var next = [];
+        for (var i=0; i<found.length; i++) {
+            var all = found[i].descendants([]);
+            for (var j=0; j<all.length; j++) {
+                if (all[j].matches(steps[s]) && next.indexOf(all[j]) < 0) {
+                    next.push(all[j]);
+                }
+            }
+        }
+        found = next;
+    }
+    return found;
+};
+
+Element.prototype.height = function(){
+    if (this.style.height) {
+        return parseFloat(this.style.height) || 0;
+    }
+    if (this.classes.indexOf('gpu-line') >= 0) {
+        return 32;
+    }
+    var h = this.classes.indexOf('node-line') >= 0 ? 40 : 0;
+    for (var i=0; i<this.children.length; i++) {
+        h += this.children[i].height();
+    }
+    return h;
+};
+
+Element.prototype.top = function(){
+    if (!this.parentNode) {
+        return 0;
+    }
+    var top = this.parentNode.top();
+    var siblings = this.parentNode.children;
+    for (var i=0; i<siblings.length && siblings[i] !== this; i++) {
+        top += siblings[i].height();
+    }
+    return top;
+};
+
+Element.prototype.getBoundingClientRect = function(){
+    var top = this.top() - window.scrollY;
+    var height = this.height();
+    return {top: top, bottom: top + height, height: height};
+};
+
+Object.defineProperty(Element.prototype, 'childNodes', {
+    get: function(){ return this.children; }
+});
+
+function el(tag, selector, children){
+    var e = new Element(tag);
+    (selector.match(/[#.][^#.]+/g) || []).forEach(function(p){
+        if (p[0] == '#') {
+            e.id = p.slice(1);
+        }
+        else {
+            e.classes.push(p.slice(1));
+        }
+    });
+    (children || []).forEach(function(c){ c.parentNode = e; e.children.push(c); });
+    return e;
+}
+
+// the part of monitor_home.html that the script touches
+function build_document(){
+    var gpu_line = el('div', '.gpu-line', [
+        el('div', '.colum.gpu-idx'), el('div', '.colum.memory'), el('div', '.colum.utilize'),
+        el('div', '.colum.users'), el('div', '.colum.schedule')]);
+    var sample = el('div', '#content-status-sample', [
+        el('div', '.node-line', [
+            el('div', '.node-info', [
+                el('div', '.colum.node-name'), el('div', '.colum.node-status'),
+                el('div', '.colum.node-version'), el('div', '.colum.node-ip')]),
+            el('div', '.gpu-list', [gpu_line])])]);
+    // the sample is hidden by the style sheet
+    sample.style.height = '0px';
+    var body = el('body', '', [
+        el('div', '#warning'),
+        el('div', '#display-area', [
+            el('div', '#head-wrapper', [
+                el('div', '#head-line', [el('div', '.head.colum.schedule')])]),
+            sample,
+            el('div', '#content-status')])]);
+    body.style.height = '0px';
+    return body;
+}
+
+function JQ(elements){
+    this.elements = elements;
+    this.length = elements.length;
+    for (var i=0; i<elements.length; i++) {
+        this[i] = elements[i];
+    }
+}
+
+JQ.prototype.each = function(f){
+    this.elements.forEach(f);
+    return this;
+};
+
+JQ.prototype.addClass = function(cls){
+    return this.each(function(e){
+        cls.split(/\s+/).forEach(function(c){
+            if (c && e.classes.indexOf(c) < 0) {
+                e.classes.push(c);
+                stats.writes++;
+            }
+        });
+    });
+};
+
+JQ.prototype.removeClass = function(){
+    return this.each(function(e){ e.classes = []; stats.writes++; });
+};
+
+JQ.prototype.text = function(v){
+    return this.each(function(e){
+        e.text = String(v);
+        e.html = null;
+        e.children = [];
+        stats.writes++;
+    });
+};
+
+JQ.prototype.html = function(v){
+    return this.each(function(e){
+        e.html = String(v);
+        e.text = '';
+        e.children = [];
+        stats.writes++;
+    });
+};
+
+JQ.prototype.attr = function(k, v){
+    return this.each(function(e){ e.attrs[k] = v; stats.writes++; });
+};
+
+JQ.prototype.css = function(k, v){
+    if (v === undefined) {
+        return this.length ? this[0].style[k] : undefined;
+    }
+    return this.each(function(e){ e.style[k] = v; stats.writes++; });
+};
+
+JQ.prototype.append = function(other){
+    var target = this[0];
+    other.elements.forEach(function(c){ target.appendChild(c); });
+    return this;
+};
+
+JQ.prototype.empty = function(){
+    return this.each(function(e){
+        if (e.children.length || e.text || e.html) {
+            e.children.forEach(function(c){ c.parentNode = null; });
+            e.children = [];
+            e.text = '';
+            e.html = null;
+            stats.writes++;
+        }
+    });
+};
+
+JQ.prototype.remove = function(){
+    return this.each(function(e){
+        if (e.parentNode) {
+            e.parentNode.removeChild(e);
+        }
+    });
+};
+
+JQ.prototype.find = function(selector){
+    var found = [];
+    this.each(function(e){ found = found.concat(e.query(selector)); });
+    return new JQ(found);
+};
+
+JQ.prototype.children = function(){
+    var found = [];
+    this.each(function(e){ found = found.concat(e.children); });
+    return new JQ(found);
+};
+
+JQ.prototype.clone = function(){
+    return new JQ(this.elements.map(function(e){ return e.cloneNode(); }));
+};
+
+JQ.prototype.ready = function(f){
+    f();
+    return this;
+};
+
+JQ.prototype.click = function(){
+    return this;
+};
+
+var body = build_document();
+var document = {
+    body: body,
+    documentElement: body,
+    getElementById: function(id){ return body.query('#' + id)[0]; }
+};
+
+function $(arg){
+    if (arg === document) {
+        return new JQ([]);
+    }
+    if (arg instanceof Element) {
+        return new JQ([arg]);
+    }
+    var tag = /^<(\w+)><\/\w+>$/.exec(arg);
+    if (tag) {
+        return new JQ([new Element(tag[1])]);
+    }
+    if (arg == 'body') {
+        return new JQ([body]);
+    }
+    return new JQ(body.query(arg));
+}
+
+$.ajax = function(){};
+
+var listeners = {};
+var frames = [];
+var window = {
+    innerHeight: 1000,
+    scrollY: 0,
+    setInterval: function(){ return 0; },
+    clearInterval: function(){},
+    addEventListener: function(type, f){
+        (listeners[type] = listeners[type] || []).push(f);
+    },
+    requestAnimationFrame: function(f){ frames.push(f); }
+};
+
+// fire an event and run the animation frames it requests
+function dispatch(type){
+    (listeners[type] || []).forEach(function(f){ f(); });
+    var pending = frames;
+    frames = [];
+    pending.forEach(function(f){ f(); });
+}
+
+function count(selector){
+    return body.query(selector).length;
+}
+
+module.exports = {stats: stats, $: $, window: window, document: document,
+                  dispatch: dispatch, count: count};
@@ -4,27 +4,99 @@ import toml
 import logging
 from pathlib import Path
 import json
+import hmac
+import time
+import secrets
+from threading import Lock
+from typing import Optional, Dict, Tuple
 
-from flask import Flask, request, jsonify, make_response, abort
-from flask.logging import default_handler
+from flask import Flask, Response, request, jsonify, abort
 
 from next_cluster.client.client_daemon import NodeStat
+from next_cluster.utils.ratelimit import TokenBucket
 
-def build_app(node: NodeStat, passwd):
+def check_passwd(pw, passwd) -> bool:
+    """Compare password in constant time. Always pass if passwd is None."""
+    if passwd is None:
+        return True
+    if not isinstance(pw, str):
+        return False
+    return hmac.compare_digest(pw.encode('utf-8'), passwd.encode('utf-8'))
+
+def build_app(node: NodeStat, passwd, rate_limit: Optional[float] = None, 
+              rate_burst: float = 10):
+    """
+    Args:
+        rate_limit: requests per second allowed for each client address. 
+            No limit if None.
+        rate_burst: maximum burst of requests of each client
+    """
     app = Flask(__name__)
+    # ETags differ across restarts, as the status version starts from 0
+    etag_prefix = secrets.token_hex(4)
+
+    # client address -> (limiter, time of the last request)
+    limiters: Dict[str, Tuple[TokenBucket, float]] = {}
+    limiter_lock = Lock()
+    # a limiter idle for this long is full again, the same as a new one
+    idle_time = rate_burst / rate_limit if rate_limit else 0
+    last_sweep = [time.monotonic()]
+
+    @app.before_request
+    def limit_client():
+        if rate_limit is None:
+            return
+        addr = request.remote_addr
+        now = time.monotonic()
+        with limiter_lock:
+            if now - last_sweep[0] > max(idle_time, 60):
+                # drop limiters of idle clients
+                for k in [k for k, (_, t) in limiters.items() if now - t > idle_time]:
+                    del limiters[k]
+                last_sweep[0] = now
+            limiter = limiters[addr][0] if addr in limiters else TokenBucket(rate_limit, rate_burst)
+            limiters[addr] = (limiter, now)
+        if not limiter.try_acquire():
+            abort(429)
+
+    def status_response():
+        """Serialized status shared by all callers of the same status version"""
+        version, body = node.status_json()
+        resp = Response(body, mimetype = 'application/json')
+        resp.set_etag(f'{etag_prefix}-{version}')
+        return resp
 
     @app.route('/get-status', methods = ['POST'])
     def node_status():
-        pw = request.json.get('passwd', None)
-        if passwd is None or pw == passwd:
-            return jsonify(node.status)
+        pw = request.get_json(silent = True, force = True) or {}
+        if check_passwd(pw.get('passwd'), passwd):
+            return status_response()
+        else:
+            abort(404)
+
+    @app.route('/status', methods = ['GET'])
+    def node_status_get():
+        """Status with the password in the `X-Auth-Token` header, cacheable by proxies"""
+        if check_passwd(request.headers.get('X-Auth-Token'), passwd):
+            resp = status_response()
+            resp.headers['Cache-Control'] = f'max-age={int(node.interval)}'
+            resp.vary.add('X-Auth-Token')
+            return resp.make_conditional(request)
         else:
             abort(404)
     
+    @app.route('/proc-events', methods = ['POST'])
+    def proc_events():
+        data = request.get_json(silent = True, force = True) or {}
+        if check_passwd(data.get('passwd'), passwd):
+            return jsonify(node.proc_events(data.get('since')))
+        else:
+            abort(404)
+
     @app.route('/', methods = ['GET'])
     def home():
         pw = request.args.get('passwd')
-        if passwd is None or pw == passwd:
+        if check_passwd(pw, passwd):
             return json.dumps(node.status, indent = 4, ensure_ascii= False)
         else:
             abort(404)
@@ -39,6 +111,10 @@ def main():
     # can also pass arguments via command line arguments
     parser.add_argument('--interval', type = int, default=None)
     parser.add_argument('--interval_proc', type = int, default=None)
+    parser.add_argument('--interval_static', type = int, default=None)
+    parser.add_argument('--proc_mode', choices = ['poll', 'event'], default=None,
+                        help = 'track gpu processes by polling nvidia-smi or by NVML events')
+    parser.add_argument('--interval_exit', type = float, default=None)
     parser.add_argument('--extra_keys', nargs = '+', default=None)
     parser.add_argument('--port', type = int, default = None,
                         help = 'Port to access node status. (ip:port/get-status)')
@@ -56,11 +132,12 @@ def main():
         config = {}
     
     # overwrite cmd args
-    node_keys = ['interval', 'interval_proc', 'extra_keys']
-    all_keys = node_keys + ['port', 'passwd']
+    node_keys = ['interval', 'interval_proc', 'interval_static', 'extra_keys',
+                 'proc_mode', 'interval_exit', 'telemetry']
+    all_keys = node_keys + ['port', 'passwd', 'rate_limit', 'rate_burst']
 
     for key in all_keys:
-        v = args.__dict__[key]
+        v = args.__dict__.get(key) # some keys are only in the config file
         if v is not None:
             print(f'Overwrite config key: {key}={v}')
             config[key] = v
@@ -73,10 +150,12 @@ def main():
     n_stat.start()
 
     # Build flask app
-    app = build_app(n_stat, config['passwd'])
+    app = build_app(n_stat, config['passwd'], 
+                    rate_limit = config.get('rate_limit'),
+                    rate_burst = config.get('rate_burst', 10))
     log = logging.getLogger('werkzeug')
     log.setLevel(logging.WARNING)
-    app.run(host = '0.0.0.0', port = args.port, threaded = True)
+    app.run(host = '0.0.0.0', port = config.get('port'), threaded = True)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
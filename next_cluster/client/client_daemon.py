@@ -19,18 +19,140 @@ Node status format:
             username: str
             mem(MiB): int
             command: str
+            util: int, percent. Only with the `proc_util` telemetry field
+        (telemetry fields, e.g., power, sm_clock. See `TELEMETRY_FIELDS`)
 """
 import time
-from threading import Thread, Lock
-from typing import List, Tuple, Dict, Any
+import json
+import heapq
+from threading import Thread, Lock, Condition
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Any, Callable, Optional
 from datetime import datetime
-from copy import deepcopy
-
 from next_cluster.utils.gpu_status import (
-    get_gpu_serial, get_gpu_stat, GPU_STAT, get_gpu_process
+    get_gpu_serial, get_gpu_stat, GPU_STAT, GPU_PROC, get_gpu_process, GPUProcTracker,
+    GPUTelemetry
 )
 from next_cluster.utils.net_status import get_hostname, get_if_ip
 
+class MetricSource:
+    """
+    A source of node status collected periodically.
+
+    Args:
+        name: name of the source
+        func: function to return the value
+        interval: refresh interval (seconds)
+        cost: estimated seconds of one call. Updated with measured time.
+        static: if True, the value rarely changes and `callback` is only 
+            called when the value changes
+        callback: function called with the new value
+    """
+    def __init__(self, name: str, func: Callable[[], Any], interval: float,
+                 cost: float = 0., static: bool = False,
+                 callback: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cost = cost
+        self.static = static
+        self.callback = callback
+        self.value = None
+        self.next_run = 0. # monotonic time of next run
+        self.last_run = None # wall time of last successful run
+
+class Collector:
+    """
+    Run all metric sources from a single scheduler thread.
+
+    Cheap sources run on the scheduler thread. Sources that cost more than
+    `pool_cost` seconds, e.g., calling nvidia-smi, run in a small thread pool 
+    so that they do not delay other sources. A source is rescheduled after 
+    its run finishes, so runs of one source never overlap.
+    """
+    def __init__(self, pool_size: int = 2, pool_cost: float = 0.2):
+        self.sources: Dict[str, MetricSource] = {}
+        self.pool_cost = pool_cost
+        self._heap: List[Tuple[float, str]] = []
+        self._cond = Condition()
+        self._stopped = False
+        self._pool = ThreadPoolExecutor(pool_size, thread_name_prefix = 'collector')
+        self._thread = Thread(target = self._loop, name = 'th_collector')
+        self._thread.daemon = True
+
+    def register(self, name: str, func: Callable[[], Any], interval: float, **kwargs):
+        """Add a source. It runs as soon as the collector starts. See `MetricSource` for arguments."""
+        src = MetricSource(name, func, interval, **kwargs)
+        with self._cond:
+            self.sources[name] = src
+            heapq.heappush(self._heap, (src.next_run, name))
+            self._cond.notify()
+        return src
+
+    def start(self):
+        self._thread.start()
+
+    def run_once(self):
+        """Run all sources once in the current thread"""
+        for src in list(self.sources.values()):
+            self._run(src, reschedule = False)
+
+    def stop(self):
+        """Stop the scheduler thread. Runs in the pool finish."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self._pool.shutdown()
+
+    def _loop(self):
+        print('Start collector')
+        while True:
+            with self._cond:
+                while not self._stopped and (
+                        not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                _, name = heapq.heappop(self._heap)
+            src = self.sources[name]
+            if src.cost > self.pool_cost:
+                self._pool.submit(self._run, src)
+            else:
+                self._run(src)
+
+    def _run(self, src: MetricSource, reschedule = True):
+        start = time.monotonic()
+        try:
+            value = src.func()
+            if not (src.static and value == src.value):
+                if src.callback is not None:
+                    src.callback(value)
+                # set after the callback, so a failed callback of a static source is retried
+                src.value = value
+        except Exception as e:
+            print(f'Fail to collect {src.name}: {repr(e)}')
+        else:
+            src.last_run = time.time()
+        end = time.monotonic()
+        # moving average of running time
+        src.cost = 0.8 * src.cost + 0.2 * (end - start)
+        if reschedule:
+            with self._cond:
+                src.next_run = end + src.interval
+                heapq.heappush(self._heap, (src.next_run, src.name))
+                self._cond.notify()
+
+    def schedule(self) -> Dict[str, Dict[str, Any]]:
+        """Return interval, cost and seconds to the next run of each source"""
+        now = time.monotonic()
+        return {name: {'interval': src.interval,
+                       'cost': src.cost,
+                       'static': src.static,
+                       'next_run': max(src.next_run - now, 0)}
+                for name, src in self.sources.items()}
+
 class NodeStat:
     """
     Maintain the node status and run as a daemon. 
@@ -41,8 +163,12 @@ class NodeStat:
     EXTRA_KEY_FUNC_MAP = {
         'ips': get_if_ip
     }
+    # Extra keys whose values rarely change. They are refreshed every `interval_static` seconds.
+    STATIC_KEYS = ['hostname', 'ips']
 
-    def __init__(self, interval = 4, interval_proc = 10, extra_keys = ['ips']):
+    def __init__(self, interval = 4, interval_proc = 10, extra_keys = ['ips'],
+                 interval_static = 60, proc_mode = 'poll', interval_exit = 1,
+                 telemetry: Optional[Dict[str, float]] = None):
         """
         Args:
             interval: refresh interval (seconds) of general information
@@ -50,6 +176,16 @@ class NodeStat:
             extra_keys: List of key names of information that you want to include 
                 in the status dict. You have to implement the function to get the 
                 information. Here, just give an example of ip addresses
+            interval_static: refresh interval (seconds) of information that rarely 
+                changes, e.g., hostname and ip addresses
+            proc_mode: how to track gpu processes
+                - poll: run nvidia-smi every `interval_proc` seconds
+                - event: query NVML every `interval_proc` seconds for new processes and
+                    check process exits every `interval_exit` seconds. 
+                    Process start/stop events are recorded.
+            interval_exit: interval (seconds) to check process exits in event mode
+            telemetry: map from extra telemetry field to its refresh interval (seconds).
+                Fields are added to each gpu. See `TELEMETRY_FIELDS` for available fields.
         """
         self._status = {'hostname': None,
                         'last_update': None,
@@ -59,59 +195,121 @@ class NodeStat:
             self._status[key] = None
         
         # the dict to host gpu process information returned by get_gpu_process
-        self._gpu_proc_status: Dict[int, List[Dict[str, Any]]] = {}
+        self._gpu_proc_status: Dict[int, List[GPU_PROC]] = {}
+        # gpu index -> telemetry field -> value
+        self._telemetry: Dict[int, Dict[str, Any]] = {}
+        # increase when the status changes. Used to share the serialized status.
+        self.version = 0
+        self._json_lock = Lock()
+        self._json_cache: Tuple[int, Optional[bytes]] = (-1, None)
 
         self.interval = interval 
         self.interval_proc = interval_proc
+        self.interval_static = interval_static
+        self.proc_mode = proc_mode
+        self.interval_exit = interval_exit
+        self.proc_tracker = GPUProcTracker() if proc_mode == 'event' else None
+        self.telemetry = GPUTelemetry(telemetry) if telemetry else None
 
         self.serial_map: Dict[str, int] = get_gpu_serial()
 
-        self.th_referesh = Thread(target = self.daemon_func, name = 'th_referesh')
-        # Thread to update gpu process information
-        self.th_proc = Thread(target = self.daemon_proc_func, name = 'th_proc')
-
-        # set daemon thread that will exit when main thread is exiting.
-        self.th_referesh.daemon = True
-        self.th_proc.daemon = True
+        self.collector = Collector()
+        self.register_sources()
     
-    def start(self):
-        self.th_referesh.start()
-        self.th_proc.start()
+    def register_sources(self):
+        """Register the function to collect each part of the status"""
+        c = self.collector
+        c.register('gpus', get_gpu_stat, self.interval, callback = self._set_gpus)
+        if self.proc_tracker is None:
+            c.register('gpu_procs', lambda: get_gpu_process(self.serial_map), 
+                       self.interval_proc, cost = 1., callback = self._set_procs)
+        else:
+            tracker = self.proc_tracker
+            c.register('gpu_procs', tracker.poll, self.interval_proc, 
+                       callback = self._on_proc_change)
+            c.register('gpu_proc_exits', tracker.check_exits, self.interval_exit,
+                       callback = self._on_proc_change)
+        if self.telemetry is not None:
+            c.register('telemetry', self.telemetry.collect, self.telemetry.interval,
+                       callback = self._set_telemetry)
+        for key in ['hostname'] + self.extra_keys:
+            func = get_hostname if key == 'hostname' else self.EXTRA_KEY_FUNC_MAP[key]
+            static = key in self.STATIC_KEYS
+            c.register(key, func, 
+                       self.interval_static if static else self.interval,
+                       static = static,
+                       callback = self._status_setter(key))
 
-    def referesh(self):
-        """Update node general information and gpu usages excluding gpu processes"""
-        self._status['hostname'] = get_hostname()
+    def _status_setter(self, key):
+        def _set(value):
+            self._status[key] = value
+            self.version += 1
+        return _set
+
+    def _set_gpus(self, gpus: List[GPU_STAT]):
+        self._status['gpus'] = gpus
         self._status['last_update'] = datetime.now().isoformat()
-        self._status['gpus'] = [k.to_dict() for k in get_gpu_stat()]
+        self.version += 1
 
-        # Get the information of extra keys
-        for key in self.extra_keys:
-            self._status[key] = self.EXTRA_KEY_FUNC_MAP[key]()
-    
-    def daemon_func(self):
-        """THe daemon to periodically referesh device infomation"""
-        print(f'Start monitor daemon')
-        while True:
-            self.referesh()
-            time.sleep(self.interval)
-    
-    def daemon_proc_func(self):
-        """The daemon to update process information"""
-        print('Start process monitor daemon')
-        while True:
-            self._gpu_proc_status = get_gpu_process(self.serial_map)
-            time.sleep(self.interval_proc)    
+    def _set_procs(self, gpu2procs: Dict[int, List[GPU_PROC]]):
+        self._gpu_proc_status = gpu2procs
+        self.version += 1
+
+    def _set_telemetry(self, values: Dict[int, Dict[str, Any]]):
+        self._telemetry = values
+        self.version += 1
+
+    def _on_proc_change(self, changed: bool):
+        if changed:
+            self._set_procs(self.proc_tracker.snapshot())
+
+    def proc_events(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return gpu process start/stop events after `since`. Only in event mode."""
+        if self.proc_tracker is None:
+            return []
+        return self.proc_tracker.get_events(since)
+
+    def start(self):
+        self.collector.start()
+
+    def referesh(self):
+        """Update all node information once"""
+        self.collector.run_once()
 
     @property
     def status(self):
         """Return node status in dict. Assemble gpu process information into the status"""
-        status = deepcopy(self._status)
+        status = dict(self._status)
+        gpu2procs = self._gpu_proc_status
+        telemetry = self._telemetry
+        gpus = []
         for gpu in status['gpus']:
-            idx = gpu['index']
-            gpu['users'] = self._gpu_proc_status.get(idx, [])
+            gpu = gpu.to_dict()
+            gpu.update(telemetry.get(gpu['index'], {}))
+            proc_util = gpu.pop('proc_util', None) or {}
+            gpu['users'] = [p.to_dict() for p in gpu2procs.get(gpu['index'], [])]
+            for p in gpu['users']:
+                if p['pid'] in proc_util:
+                    p['util'] = proc_util[p['pid']]
+            gpus.append(gpu)
+        status['gpus'] = gpus
 
         return status
 
+    def status_json(self) -> Tuple[int, bytes]:
+        """
+        Return the status version and the status serialized in JSON.
+
+        The result is cached for each version, so concurrent callers 
+        serialize the status only once.
+        """
+        with self._json_lock:
+            version = self.version
+            if self._json_cache[0] != version:
+                body = json.dumps(self.status, ensure_ascii = False).encode('utf-8')
+                self._json_cache = (version, body)
+            return self._json_cache
+
 if __name__ == '__main__':
     import json
 
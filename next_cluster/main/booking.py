@@ -0,0 +1,236 @@
+"""
+Bookings of all calendars in a rolling window of days and the booking rules.
+
+Bookings are kept as date intervals of each gpu with absolute dates, indexed
+by gpu and by (user, gpu), so memory and checks scale with the number of
+bookings rather than bookings x days. The window covers `num_days` dates
+from today. The counters used by the booking rules are updated only for
+bookings that changed or that cover the dates entering or leaving the window:
+    - number of gpus booked by each user
+    - number of days each user books each gpu
+"""
+from typing import Optional, Dict, List, Tuple, Callable, Iterable, Any, Set
+from collections import defaultdict, Counter
+from bisect import bisect_right
+import datetime
+
+from next_cluster.utils.teamup import Booking, local_today, split_who
+
+# code
+## booking error code
+GOOD_BOOK = 0
+INVALID_BOOK_INFO = 1
+EXCEED_MAX_BOOK_GPU = 2
+EXCEED_MAX_BOOK_DAY = 3
+
+def _today() -> datetime.date:
+    return local_today().date()
+
+class BookingWindow:
+    """
+    Args:
+        num_days: number of days in the window
+        max_gpu_per_user: maximum gpus a user can book in the window
+        max_days_per_gpu: maximum days a user can book a gpu in the window
+        clock: function to return the date of today. Replace it in tests.
+    """
+    def __init__(
+            self,
+            num_days: int,
+            max_gpu_per_user: int,
+            max_days_per_gpu: int,
+            users: Iterable[str] = (),
+            clock: Callable[[], datetime.date] = _today
+        ):
+        self.num_days = num_days
+        self.max_gpu_per_user = max_gpu_per_user
+        self.max_days_per_gpu = max_days_per_gpu
+        self.clock = clock
+        self.version = 0 # increase when bookings, users or the window change
+        self.users = users
+
+        self._cal: Dict[str, List[Booking]] = {} # calendar id -> bookings
+        # interval index. (hostname, index) -> (calendar id, booking) sorted by start date
+        self._gpus: Dict[Tuple[str, int], List[Tuple[str, Booking]]] = {}
+        self._gpu_starts: Dict[Tuple[str, int], List[datetime.date]] = {}
+        # (title, hostname, index) -> (calendar id, booking)
+        self._by_key: Dict[Tuple[str, str, int], List[Tuple[str, Booking]]] = {}
+        # (title, hostname, index) -> number of booked days in the window
+        self._gpu_days: Dict[Tuple[str, str, int], int] = {}
+        # title -> booked gpus in the window
+        self._user_gpus: Dict[str, Set[Tuple[str, int]]] = defaultdict(set)
+
+        self.start = clock()
+
+    @property
+    def users(self) -> Set[str]:
+        return self._users
+
+    @users.setter
+    def users(self, users: Iterable[str]):
+        self._users = set(users)
+        self.version += 1
+
+    @property
+    def end(self) -> datetime.date:
+        return self.start + datetime.timedelta(days = self.num_days)
+
+    @property
+    def dates(self) -> List[datetime.date]:
+        return [self.start + datetime.timedelta(days = i) for i in range(self.num_days)]
+
+    @property
+    def date_list(self) -> List[str]:
+        return [d.strftime('%Y %m %d') for d in self.dates]
+
+    def _count_days(self, key) -> int:
+        """Number of days in the window covered by the bookings of (title, hostname, index)"""
+        spans = sorted((max(bk.start, self.start), min(bk.end, self.end))
+                       for _, bk in self._by_key.get(key, []))
+        n = 0
+        last_end = self.start
+        for st, ed in spans:
+            st = max(st, last_end)
+            if ed > st:
+                n += (ed - st).days
+                last_end = ed
+        return n
+
+    def _update_keys(self, keys: Iterable[Tuple[str, str, int]]):
+        for key in keys:
+            n = self._count_days(key)
+            title, gpu = key[0], key[1:]
+            if n > 0:
+                self._gpu_days[key] = n
+                self._user_gpus[title].add(gpu)
+            else:
+                self._gpu_days.pop(key, None)
+                self._user_gpus[title].discard(gpu)
+                if not self._user_gpus[title]:
+                    del self._user_gpus[title]
+
+    @staticmethod
+    def _replace(index: Dict, key, cal_id: str, new: List[Booking]):
+        entries = [e for e in index.get(key, []) if e[0] != cal_id]
+        entries.extend((cal_id, bk) for bk in new)
+        if entries:
+            entries.sort(key = lambda e: e[1].start)
+            index[key] = entries
+        else:
+            index.pop(key, None)
+
+    def set_calendar(self, cal_id: str, bookings: List[Booking]):
+        """
+        Replace the bookings of a calendar. Only (title, hostname, index) 
+        with changed bookings are recounted. The version is unchanged if 
+        no booking changes.
+        """
+        old = self._cal.get(cal_id, [])
+        self._cal[cal_id] = bookings
+        if old == bookings:
+            return
+
+        old_by_key = defaultdict(Counter)
+        new_by_key = defaultdict(list)
+        new_by_gpu = defaultdict(list)
+        for bk in old:
+            old_by_key[(bk.title, bk.hostname, bk.index)][bk] += 1
+        for bk in bookings:
+            new_by_key[(bk.title, bk.hostname, bk.index)].append(bk)
+            new_by_gpu[(bk.hostname, bk.index)].append(bk)
+        keys = [key for key in set(old_by_key).union(new_by_key)
+                if old_by_key.get(key, Counter()) != Counter(new_by_key.get(key, []))]
+        if not keys:
+            # same bookings in another order
+            return
+
+        for key in keys:
+            self._replace(self._by_key, key, cal_id, new_by_key.get(key, []))
+        for gpu in {key[1:] for key in keys}:
+            self._replace(self._gpus, gpu, cal_id, new_by_gpu.get(gpu, []))
+            if gpu in self._gpus:
+                self._gpu_starts[gpu] = [bk.start for _, bk in self._gpus[gpu]]
+            else:
+                self._gpu_starts.pop(gpu, None)
+        self._update_keys(keys)
+        self.version += 1
+
+    def advance(self) -> bool:
+        """Move the window to start from today. Return whether the window moved."""
+        today = self.clock()
+        if today == self.start:
+            return False
+        old_dates = set(self.dates)
+        self.start = today
+        changed = old_dates.symmetric_difference(self.dates)
+        # only bookings covering dates entering or leaving the window change
+        keys = [key for key, entries in self._by_key.items()
+                if any(bk.start <= d < bk.end for _, bk in entries for d in changed)]
+        self._update_keys(keys)
+        self.version += 1
+        return True
+
+    def who_has(self, hostname: str, index: int, day: int = 0) -> List[Booking]:
+        """Return bookings of a gpu on the day (offset to today)"""
+        gpu = (hostname, index)
+        if gpu not in self._gpus:
+            return []
+        d = self.start + datetime.timedelta(days = day)
+        n = bisect_right(self._gpu_starts[gpu], d)
+        return [bk for _, bk in self._gpus[gpu][:n] if bk.end > d]
+
+    def n_gpus(self, user: str) -> int:
+        """Number of gpus booked by user in the window"""
+        return len(self._user_gpus.get(user, ()))
+
+    def n_days(self, user: str, hostname: str, index: int) -> int:
+        """Number of days user books the gpu in the window"""
+        return self._gpu_days.get((user, hostname, index), 0)
+
+    def code(self, bk: Booking) -> int:
+        """Return booking error code"""
+        if bk.title not in self.users:
+            return INVALID_BOOK_INFO
+        if self.n_gpus(bk.title) > self.max_gpu_per_user:
+            return EXCEED_MAX_BOOK_GPU
+        if self.n_days(bk.title, bk.hostname, bk.index) > self.max_days_per_gpu:
+            return EXCEED_MAX_BOOK_DAY
+        return GOOD_BOOK
+
+    def day0_users(self) -> Dict[Tuple[str, int], Set[str]]:
+        """Return map from (hostname, index) to users of good bookings today (title and who)"""
+        auth = {}
+        for hostname, index in self._gpus:
+            users = set()
+            for bk in self.who_has(hostname, index, 0):
+                if self.code(bk) == GOOD_BOOK:
+                    users.add(bk.title)
+                    users.update(split_who(bk.who))
+            if users:
+                auth[(hostname, index)] = users
+        return auth
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Return micro bookings (one gpu, one day) in the window with day offset and error code"""
+        rows = []
+        start, end = self.start, self.end
+        for gpu, starts in self._gpu_starts.items():
+            entries = self._gpus[gpu][:bisect_right(starts, end)]
+            for _, bk in entries:
+                if bk.end <= start:
+                    continue
+                code = self.code(bk)
+                first = max((bk.start - start).days, 0)
+                last = min((bk.end - start).days, self.num_days)
+                for day in range(first, last):
+                    rows.append({'title': bk.title,
+                                 'who': bk.who,
+                                 'day': day,
+                                 'hostname': bk.hostname,
+                                 'index': bk.index,
+                                 'code': code})
+        return rows
+
+    def bookings(self) -> Dict[str, List[Booking]]:
+        """Return bookings of each calendar"""
+        return dict(self._cal)
@@ -5,35 +5,39 @@
 The daemon of main node to periodically collect nodes and calendar status and aggregate the information into a dict.
 
  ---- Assemble
-    1. merge booking df -> Determin book_code
+    1. roll booking window -> Determin book_code
     2. determin user_code
     3. add calendar
 """
 
 # code
-## booking error code
-GOOD_BOOK = 0
-INVALID_BOOK_INFO = 1
-EXCEED_MAX_BOOK_GPU = 2
-EXCEED_MAX_BOOK_DAY = 3
-
 ## user code
 GOOD_USER = 0
 NO_BOOK_USER = 1
 
-from typing import Optional, Union, Dict, Any, Tuple, List
+from typing import Optional, Union, Dict, Any, Tuple, List, Set
 import json
 from collections import OrderedDict,defaultdict
 import time
 import re
+import random
 from pathlib import Path
-from datetime import date, datetime
-from threading import Thread, Lock
-import pandas as pd
+from datetime import datetime, timedelta
+from threading import Thread, Lock, Event
 import requests
-from copy import deepcopy
 
-from next_cluster.utils.teamup import get_bookings, translate_next
+from next_cluster.utils.teamup import (
+    Booking, translate_next, split_who, local_today
+)
+from next_cluster.main.booking import (
+    BookingWindow, GOOD_BOOK, INVALID_BOOK_INFO, EXCEED_MAX_BOOK_GPU, EXCEED_MAX_BOOK_DAY
+)
+from next_cluster.utils.records import GPU_STAT
+from next_cluster.utils.cache import save_state, load_state
+from next_cluster.utils.ratelimit import TokenBucket
+from next_cluster.utils.traffic import (
+    LiveBackend, RecordBackend, bookings_to_list, bookings_from_list
+)
 # from next_cluster.utils import get_linux_users
 
 def get_linux_users():
@@ -47,7 +51,8 @@ class Cluster:
     Hold status of all servers and check user booking legality.
 
     Args:
-        host_data: a list of host info in dict: nickname, ip
+        host_data: a list of host info in dict: nickname, ip, 
+            and optional port and relay (`bool`, whether the host is a relay daemon)
     
     Status information format
         Node data (fetch from each node). * denote keys added by this class.
@@ -76,12 +81,15 @@ class Cluster:
         
         Cluster Status: a dict of following keys:
             date_list
-            calendar_status: (`bool`)
+            calendar_status: (`bool`), whether all calendars are fresh
+            calendar_stale: (`bool`), some bookings are out of date or from cache
+            calendar_fresh: dict of seconds since the last fetch of each calendar
             Nodes: List of node data described above
             "illegal_users"
     """
     MAX_GPU_PER_USER = 4
     MAX_DAYS_PER_GPU = 3
+    CACHE_VERSION = 1 # increase when the format of `cache_state` changes
 
     def __init__(
             self,
@@ -96,33 +104,83 @@ class Cluster:
             node_wait = 4,
             node_expire_time = 60,
             cal_wait = 10,
-            dur_book_update = 5
+            dur_book_update = 5,
+            adaptive_poll = True,
+            cache_file = None,
+            cache_wait = 30,
+            teamup_rate = 1,
+            teamup_burst = 2,
+            cal_max_backoff = 300,
+            backend = None,
+            run_daemon = True
         ):
+        """
+        Args:
+            backend: backend to fetch nodes and calendars. Default to `LiveBackend`.
+                See `next_cluster.utils.traffic` to record the traffic.
+            run_daemon: whether to start fetching threads. Set False to feed data 
+                with `apply_node_data` and `apply_bookings`, e.g., to replay traffic.
+        """
         self.host_data = host_data
         self.port = port
         self.passwd = passwd
         self.add_calendar = add_calendar
-        self.teamup_ids = teamup_ids
+        self.teamup_ids = teamup_ids or []
         self.num_days = num_days
         self.name_translate = name_translate
         self.node_wait = node_wait
         self.node_expire_time = node_expire_time
         self.cal_wait = cal_wait
         self.dur_book_update = dur_book_update
+        self.adaptive_poll = adaptive_poll
+        self.cache_file = cache_file
+        self.cache_wait = cache_wait
+        self.cal_max_backoff = cal_max_backoff
+        self.backend = backend if backend is not None else LiveBackend()
 
         self._cluster_stat = {}
         self._linux_users = []
-        self.book_dt: Dict[str, pd.DataFrame] = {} 
-        self.book_df: pd.DataFrame = None
+        self.bookings = BookingWindow(num_days, self.MAX_GPU_PER_USER, self.MAX_DAYS_PER_GPU)
+        # booking records and indexes from user/hostname to record positions.
+        # Rebuilt on each status refresh to serve booking queries.
+        self.book_rows: List[Dict[str, Any]] = []
+        self._book_by_user: Dict[str, List[int]] = {}
+        self._book_by_host: Dict[str, List[int]] = {}
+        self._gpu_calendar: Dict[Tuple[str, int], List[List]] = {} # (host, index) -> day -> bookings
+        self._index_version = None # bookings version of the indexes
+        # (host, index) -> users allowed to use the gpu today
+        self._day0_users: Dict[Tuple[str, int], Set[str]] = {}
+        self._day0_version = None
 
         self.lock = Lock()
+        self._stop = Event() # set by `stop` to end the threads
+        self._cal_threads: List[Thread] = []
+        self._node_threads: List[Thread] = []
+        self.check_thread = None
         self.date_list = None # calendar dates, list of "xxx xx xx"
-        self.calendar_dt = None # calendar updating time
+        self.calendar_fresh: Dict[str, float] = {} # teamup id -> last fetch time
+        # shared by all calendar threads to avoid bursts of requests to Teamup
+        self.teamup_limiter = TokenBucket(teamup_rate, teamup_burst)
+        self.subcal_maps: Dict[str, Dict[int, List]] = {} # teamup id -> subcalendar to gpu map
+        self._cache_dt = time.time() # last time of saving cache
         
-        self.nodes: Dict[str, Dict] = {h['nickname']:None for h in self.host_data} # map from hostname to Node data
+        self.nodes: Dict[str, Dict] = {h['nickname']:None for h in self.host_data 
+                                       if not h.get('relay')} # map from hostname to Node data
+        self._relay_hosts: Dict[str, List[str]] = {} # map from relay to hostnames behind it
+
+        # adaptive polling schedule of each host
+        self.poll_interval: Dict[str, float] = {h['nickname']: node_wait for h in self.host_data}
+        self._next_poll: Dict[str, float] = {}
+        self._poll_fail: Dict[str, int] = defaultdict(int)
+        self._proc_sig: Dict[str, frozenset] = {}
         
 
         self.init_user_info(user_list)
+        if self.cache_file:
+            self.load_cache()
+        self.update_status()
+        if not run_daemon:
+            return
         self.init_calendar_thread()
         self.init_fetch_thread()
         self.check_thread = Thread(target = self.daemon_check_and_update, 
@@ -138,7 +196,14 @@ class Cluster:
         else:
             print('No user list provided. Default to all linux users in /etc/passwd')
             users = get_linux_users()
+        if isinstance(self.backend, RecordBackend):
+            # the replay checks users against the same list
+            self.backend.record_users(users)
+        self.set_users(users)
+
+    def set_users(self, users: List[str]):
         self._linux_users = users
+        self.bookings.users = set(users)
     
     def init_calendar_thread(self):
         if self.add_calendar:
@@ -163,152 +228,344 @@ class Cluster:
         for th in threads:
             th.start()
 
+    def stop(self, timeout: float = 5):
+        """Stop fetching and checking threads. Wait for each of them up to `timeout` seconds."""
+        self._stop.set()
+        for th in self._cal_threads + self._node_threads + [self.check_thread]:
+            if th is not None and th.is_alive():
+                th.join(timeout)
+
     def daemon_fetch_calendar(self, teamup_id):
+        """
+        Periodically fetch bookings of a calendar. 
+        
+        Requests of all calendars share a rate limiter. Intervals are jittered
+        and errors back off exponentially up to `cal_max_backoff` seconds.
+        """
         print(f'Enter calendar: {teamup_id}')
-        while True:
+        n_fail = 0
+        while not self._stop.is_set():
             try:
-                cal_data, self.date_list = get_bookings(teamup_id, 
-                                                        self.num_days,
-                                                        translate_next)
+                with self.lock:
+                    subcal_map = self.subcal_maps.get(teamup_id)
+                if subcal_map is None:
+                    subcal_map = self.backend.fetch_calendar_map(teamup_id, 
+                                                                 self.teamup_limiter)
+                    with self.lock:
+                        self.subcal_maps[teamup_id] = subcal_map
+                today = local_today()
+                bookings = self.backend.fetch_bookings(
+                    teamup_id, today, today + timedelta(days = self.num_days - 1),
+                    translate_next,
+                    subcal_map,
+                    self.teamup_limiter)
             except Exception as e:
-                print(f'Calendar {teamup_id} fail {e}')
-                time.sleep(3)
+                n_fail += 1
+                wait = min(3 * 2 ** (n_fail - 1), self.cal_max_backoff)
+                if isinstance(e, KeyError):
+                    # bookings on new subcalendars. Reload the subcalendar map.
+                    print(f'Calendar {teamup_id} unknown subcalendar {e}')
+                    with self.lock:
+                        self.subcal_maps.pop(teamup_id, None)
+                elif (isinstance(e, requests.HTTPError) 
+                        and e.response is not None and e.response.status_code == 429):
+                    retry_after = e.response.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        wait = max(wait, int(retry_after))
+                    print(f'Calendar {teamup_id} rate limited. Retry in {wait}s')
+                else:
+                    print(f'Calendar {teamup_id} fail {e}')
+                self._stop.wait(wait * random.uniform(1, 1.2))
             else:
-                lock = Lock()
-                lock.acquire()
-                self.calendar_dt = time.time()
-                cal_data = cal_data.reset_index(drop = True)
-                self.book_dt[teamup_id] = cal_data
-                lock.release()
-                time.sleep(self.cal_wait)
+                n_fail = 0
+                with self.lock:
+                    self.apply_bookings(teamup_id, bookings)
+                self._stop.wait(self.cal_wait * random.uniform(0.8, 1.2))
 
     def daemon_fetch_node(self, host_d: dict):
+        """
+        Periodically fetch the status of a node, or of all nodes behind a relay
+        if `host_d['relay']` is true (see `next_cluster.main.relay_flask`).
+        """
         # addr = host if host[0].isdigit() else host + '.' + self.domain
         host = host_d['nickname']
-        addr = host_d['ip']
-        while True:
+        port = host_d.get('port', self.port)
+        while not self._stop.is_set():
             try:
-                res = requests.post(f'http://{addr}:{self.port}/get-status', 
-                                    json = {'passwd': self.passwd},
-                                    timeout = 3)
-                data = res.json()
+                data = self.backend.fetch_node(host_d, port, self.passwd)
                 # print(f'Fetch {host}: successful')
             except Exception as e:
                 print(f'Fetch {host}: no response.{repr(e)}')
                 data = None
-            self.lock.acquire()
+            with self.lock:
+                wait = self.apply_node_data(host_d, data)
+            self._stop.wait(wait)
+
+    def apply_bookings(self, teamup_id: str, bookings: List[Booking]):
+        """Update bookings of a calendar. Should hold the lock."""
+        self.calendar_fresh[teamup_id] = time.time()
+        self.bookings.set_calendar(teamup_id, bookings)
+
+    def apply_node_data(self, host_d: dict, data: Optional[dict],
+                        now: Optional[datetime] = None) -> float:
+        """
+        Update fetched data of a node or a relay. Should hold the lock.
+        Return the waiting time before the next poll.
+
+        Args:
+            now: time of the fetch to check node expiry. Default to the current time.
+        """
+        host = host_d['nickname']
+        if host_d.get('relay', False):
+            # flatten nodes behind the relay. Nodes never reached by the relay are None.
             if data is not None:
-                data['status'] = True
-                self.nodes[host] = data
-            elif self.nodes[host] is not None:
-                q_time = datetime.fromisoformat(self.nodes[host]['last_update'])
-                dur = (datetime.now() - q_time).total_seconds()
-                self.nodes[host]['status'] = (dur <= self.node_expire_time)
-            
-            self.lock.release()
-            time.sleep(self.node_wait)
-    
-    def daemon_check_and_update(self):
-        """Check legality and update status dict"""
-        while True:
-            time.sleep(self.dur_book_update)
-            self.lock.acquire()
-            if self.add_calendar:
-                df = pd.concat(list(self.book_dt.values()), axis = 0).reset_index(drop = True)
+                self._relay_hosts[host] = list(data['nodes'].keys())
+                nodes = {k: v for k, v in data['nodes'].items() if v is not None}
             else:
-                df = pd.DataFrame([], columns = 'title who day hostname index'.split())
-            self.book_df = self.add_booking_check(df)
-            self.update_user_code()
-            self._cluster_stat = self.assemble()
-            self.lock.release()
-            
-    def add_booking_check(self, df: pd.DataFrame):
-        """Add booking error code column"""
-        # df columns: title, who, hostname, index, day
-
-        # Invalid booking = 1
-        df['invalid_book'] = df['title'].apply(lambda k: k not in self._linux_users)
-
-        # Exceed maximum gpu number
-        # title -> whether violate
-        group = df.groupby('title')
-        u2ngpu = group.apply(lambda k: (k['hostname'] + k['index'].astype(str)).nunique())
-        violate_ngpu = u2ngpu.apply(lambda k: k > self.MAX_GPU_PER_USER)
-        violate_ngpu.name = 'violate_ngpu'
-
-        if len(violate_ngpu) > 0:
-            violate_ngpu = violate_ngpu.reset_index()
-
-        # Exceed maximum days per gpu
-        # (title, hostname, index) -> whether violate
-        g2 = df.groupby(['title','hostname', 'index'])
-        gpu2day = g2.apply(lambda k: k['day'].nunique())
-        violate_day = gpu2day.apply(lambda k: k > self.MAX_DAYS_PER_GPU)
-        violate_day.name = 'violate_day'
-        if len(violate_day) > 0:
-            violate_day = violate_day.reset_index()
-
-        # Merge to original dataframe
-        if len(violate_ngpu) > 0:
-            df = df.merge(violate_ngpu, how = 'left', on = ['title'])
+                nodes = {}
+            for child in self._relay_hosts.get(host, []):
+                self.nodes.setdefault(child, None)
+                self.update_node(child, nodes.get(child), now)
         else:
-            df['violate_ngpu'] = [False] * len(df)
+            nodes = {host: data} if data is not None else {}
+            self.update_node(host, data, now)
+        
+        return self.update_poll_interval(
+            host, list(nodes.values()) if data is not None else None)
+
+    def update_node(self, host, data: Optional[dict], now: Optional[datetime] = None):
+        """Update node data. Mark node as expired if no data for a long time."""
+        if data is not None:
+            # node data from a relay already has the status determined by the relay
+            data.setdefault('status', True)
+            data['gpus'] = [GPU_STAT.from_dict(g) for g in data['gpus']]
+            self.nodes[host] = data
+        elif self.nodes.get(host) is not None:
+            q_time = datetime.fromisoformat(self.nodes[host]['last_update'])
+            dur = ((now or datetime.now()) - q_time).total_seconds()
+            self.nodes[host]['status'] = (dur <= self.node_expire_time)
+
+    def update_poll_interval(self, host, nodes: Optional[List[dict]]) -> float:
+        """
+        Return the waiting time before the next poll of a host.
 
-        if len(violate_day) > 0:
-            df = df.merge(violate_day, how = 'left', on = ['title', 'hostname', 'index'])
-        else:
-            df['violate_day'] = [False] * len(df)
-
-        # invalid book, violate max gpu, violate max day
-        # True, *, * -> 1
-        # False, True, * -> 2
-        # False, False, True -> 3
-        # False, False, False -> 0
-        def status2code(inv_bk, vio_gpu, vio_day):
-            args= [inv_bk, vio_gpu, vio_day]
-            if any(args):
-                return args.index(True) + 1
-            else:
-                return 0
-        status_df = pd.concat([df.pop(k) for k in ['invalid_book', 'violate_ngpu', 'violate_day']], axis = 1)
+        Args:
+            nodes: fetched node data of the host or of nodes behind a relay.
+                None if the host is unreachable.
 
-        if self.add_calendar:
-            if len(status_df) == 0:
-                df['code'] = [0] * len(df)
+        With adaptive polling:
+            - unreachable host: exponential backoff up to `node_expire_time`
+            - gpu processes changed: half of `node_wait`
+            - status unchanged: grow by 1.5x up to a third of `node_expire_time`,
+                so that the node does not expire between two polls
+        """
+        wait = self.node_wait
+        if self.adaptive_poll:
+            prev = self.poll_interval[host]
+            if nodes is None:
+                self._poll_fail[host] += 1
+                wait = min(self.node_wait * 2 ** self._poll_fail[host], 
+                           self.node_expire_time)
             else:
-                df['code'] = status_df.apply(lambda k: status2code(*k.tolist()), axis = 1)
+                self._poll_fail[host] = 0
+                sig = frozenset((node['hostname'], gpu['index'], proc['pid']) 
+                                for node in nodes
+                                for gpu in node['gpus'] for proc in gpu['users'])
+                last_sig = self._proc_sig.get(host)
+                self._proc_sig[host] = sig
+                if last_sig is None:
+                    wait = self.node_wait
+                elif sig != last_sig:
+                    wait = max(self.node_wait / 2, 1)
+                else:
+                    idle_cap = max(self.node_wait, self.node_expire_time / 3)
+                    wait = min(max(prev, self.node_wait) * 1.5, idle_cap)
+        self.poll_interval[host] = wait
+        self._next_poll[host] = time.time() + wait
+        return wait
+
+    def get_poll_schedule(self) -> Dict[str, Dict[str, Any]]:
+        """Return the current polling interval and next poll time of each host"""
+        with self.lock:
+            return {host: {'interval': self.poll_interval[host],
+                           'next_poll': self._next_poll.get(host),
+                           'failures': self._poll_fail[host]}
+                    for host in self.rank_node(list(self.poll_interval.keys()))}
+    
+    def daemon_check_and_update(self):
+        """Check legality and update status dict. Save cache periodically."""
+        while not self._stop.wait(self.dur_book_update):
+            state = None
+            with self.lock:
+                try:
+                    self.update_status()
+                except Exception as e:
+                    # keep the thread alive. Status is refreshed on the next tick
+                    print(f'Fail to update status: {repr(e)}')
+                if self.cache_file and time.time() - self._cache_dt > self.cache_wait:
+                    state = self.cache_state()
+                    self._cache_dt = time.time()
+            if state is not None:
+                try:
+                    save_state(self.cache_file, state)
+                except Exception as e:
+                    print(f'Fail to save cache: {repr(e)}')
+
+    def update_status(self):
+        """Check booking legality and assemble the status dict"""
+        self.bookings.advance()
+        if self.add_calendar:
+            self.date_list = self.bookings.date_list
+        # indexes are rebuilt only when bookings, users or the window change
+        if self._index_version != self.bookings.version:
+            self.index_bookings(self.bookings.rows())
+            self._index_version = self.bookings.version
+        self.update_user_code()
+        self._cluster_stat = self.assemble()
+
+    def cache_state(self) -> Dict[str, Any]:
+        """
+        Return bookings, subcalendar maps and node status to be saved. Should hold the lock.
+        The result shares no mutable objects with the cluster, so it can be saved without the lock.
+        """
+        return {
+            'version': self.CACHE_VERSION,
+            'bookings': {cal_id: bookings_to_list(bks)
+                         for cal_id, bks in self.bookings.bookings().items()},
+            'subcal_maps': {tid: {k: list(v) for k, v in m.items()}
+                            for tid, m in self.subcal_maps.items()},
+            'relay_hosts': {k: list(v) for k, v in self._relay_hosts.items()},
+            'nodes': {host: self.node_to_dict(node) if node is not None else None
+                      for host, node in self.nodes.items()}
+        }
+
+    def load_cache(self):
+        """
+        Load saved bookings and node status. They are marked stale until refreshed.
+        A cache of another format version is ignored.
+        """
+        state = load_state(self.cache_file)
+        if state is None:
+            return
+        if not isinstance(state, dict) or state.get('version') != self.CACHE_VERSION:
+            print(f'Ignore cache {self.cache_file} of another version')
+            return
+        try:
+            # json keys are str
+            subcal_maps = {tid: {int(k): v for k, v in m.items()}
+                           for tid, m in state['subcal_maps'].items()
+                           if tid in self.teamup_ids}
+            bookings = {cal_id: bookings_from_list(bks) 
+                        for cal_id, bks in state['bookings'].items()
+                        if cal_id in self.teamup_ids}
+            relays = [h['nickname'] for h in self.host_data if h.get('relay')]
+            relay_hosts = {k: list(v) for k, v in state['relay_hosts'].items() if k in relays}
+            hosts = set(self.nodes.keys()).union(*relay_hosts.values())
+            nodes = {}
+            for host, node in state['nodes'].items():
+                if host not in hosts or node is None:
+                    continue
+                node['status'] = False
+                node['stale'] = True
+                node['gpus'] = [GPU_STAT.from_dict(g) for g in node['gpus']]
+                nodes[host] = node
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            print(f'Ignore invalid cache {self.cache_file}: {repr(e)}')
+            return
+        print(f'Load cache from {self.cache_file}')
+
+        self.subcal_maps = subcal_maps
+        for cal_id, bks in bookings.items():
+            self.bookings.set_calendar(cal_id, bks)
+        self._relay_hosts = relay_hosts
+        self.nodes.update(nodes)
+        for host in hosts:
+            self.nodes.setdefault(host, None)
+
+    def index_bookings(self, rows: List[Dict[str, Any]]):
+        """Build the user and hostname indexes and calendars of gpus from booking records"""
+        rows = sorted(rows, key = lambda r: (r['hostname'], r['index'], r['day'], r['title']))
+        by_user = defaultdict(list)
+        by_host = defaultdict(list)
+        gpu_calendar = {}
+        for i, row in enumerate(rows):
+            # a booking belongs to its title and all users sharing it
+            for user in dict.fromkeys([row['title'], *split_who(row['who'])]):
+                by_user[user].append(i)
+            by_host[row['hostname']].append(i)
+            
+            key = (row['hostname'], row['index'])
+            if key not in gpu_calendar:
+                gpu_calendar[key] = [[] for _ in range(self.num_days)]
+            gpu_calendar[key][row['day']].append([row['title'], row['who'], row['code']])
+        self.book_rows = rows
+        self._book_by_user = dict(by_user)
+        self._book_by_host = dict(by_host)
+        self._gpu_calendar = gpu_calendar
+
+    def query_bookings(
+            self,
+            user: Optional[str] = None,
+            host: Optional[str] = None,
+            gpu: Optional[int] = None,
+            day: Optional[int] = None,
+            page: int = 1,
+            page_size: int = 50
+        ) -> Dict[str, Any]:
+        """
+        Return one page of booking records that match all given filters.
+
+        Records are looked up from the user or hostname index, so the cost 
+        depends on the number of matched bookings rather than all bookings.
+        """
+        with self.lock:
+            rows = self.book_rows
+            by_user = self._book_by_user
+            by_host = self._book_by_host
+
+        if user is not None:
+            cand = by_user.get(user, [])
+        elif host is not None:
+            cand = by_host.get(host, [])
         else:
-            df['code'] = [0] * len(df)
-        return df
+            cand = range(len(rows))
+        
+        matched = []
+        for i in cand:
+            row = rows[i]
+            if ((host is None or row['hostname'] == host)
+                    and (gpu is None or row['index'] == gpu)
+                    and (day is None or row['day'] == day)):
+                matched.append(row)
+        
+        page = max(page, 1)
+        page_size = max(page_size, 1)
+        start = (page - 1) * page_size
+        return {'total': len(matched),
+                'page': page,
+                'page_size': page_size,
+                'bookings': matched[start: start + page_size]}
 
     def update_user_code(self):
         """Based on booking info, update process user code"""
-        df = self.book_df
+        # users of good bookings today are rebuilt only when bookings change
+        if self._day0_version != self.bookings.version:
+            self._day0_users = self.bookings.day0_users()
+            self._day0_version = self.bookings.version
+        # also nodes marked down by a relay or loaded from cache, which still show processes
         for host, node in self.nodes.items():
-            if node is None or not node['status']:
+            if node is None:
                 continue
             for gpu in node['gpus']:
-                # get current day book
-                condition = ((df['hostname'] == host) &
-                             (df['index'] == gpu['index']) &
-                             (df['day'] == 0)
-                             & (df['code'] == 0))
-                part = df[condition]['title'] + df[condition]['who']
-                bname = ' '.join(part.unique())
+                users = self._day0_users.get((host, gpu['index']), ())
                 for proc in gpu['users']:
-                    try:
-                        proc['user_code'] = int(proc['username'] not in bname)
-                    except:
-                        print('Code error: ', proc['username'], bname)
+                    proc['user_code'] = int(proc['username'] not in users)
 
     def _psudo_node(self, host):
         # get host gpu number from booking
-        df = self.book_df
-        all_ind = df[df['hostname'] == host]['index']
-        if len(all_ind) > 0:
-            n = all_ind.max().item() + 1
-        else:
-            n = 0
+        rows = self.book_rows
+        all_ind = [rows[i]['index'] for i in self._book_by_host.get(host, [])]
+        n = max(all_ind) + 1 if all_ind else 0
         gpus = [{'index': i,
                  'name': '',
                  'use_mem': 0,
@@ -318,21 +575,18 @@ class Cluster:
         return {'hostname': host, 'status': False, 'gpus': gpus}
 
     def get_gpu_calendar(self, host, index):
-        df = self.book_df
-        bk_days = [[] for _ in range(len(self.date_list))]
-
-        gpu_df: pd.DataFrame = df[(df['hostname'] == host) & (df['index'] == index)]
-        if len(gpu_df) == 0:
-            return bk_days
-        
-        day_gp = gpu_df.groupby('day')
-        def _df2list(df):
-            return df.apply(lambda r: r.tolist(), axis = 1).tolist()
-        daybk_ser = day_gp[['title', 'who', 'code']].apply(_df2list)
-        for day, bks in daybk_ser.items():
-            bk_days[day] = bks
+        bk_days = self._gpu_calendar.get((host, index))
+        if bk_days is None:
+            return [[] for _ in range(self.num_days)]
         return bk_days
 
+    @staticmethod
+    def node_to_dict(node: Dict[str, Any]) -> Dict[str, Any]:
+        """Serialize node data with gpu records into a new dict"""
+        node = dict(node)
+        node['gpus'] = [g.to_dict() for g in node['gpus']]
+        return node
+
     def assemble(self):
         """
         Assemble node status and booking information.
@@ -341,6 +595,11 @@ class Cluster:
         status = OrderedDict()
         status['date_list'] = self.date_list
         status['calendar_status'] = self.calendar_status
+        status['calendar_stale'] = self.calendar_stale
+        now = time.time()
+        status['calendar_fresh'] = {tid: now - self.calendar_fresh[tid] 
+                                         if tid in self.calendar_fresh else None
+                                    for tid in self.teamup_ids}
         status['teamup_ids'] = self.teamup_ids
         status['Nodes'] = []
         illegal_users = set()
@@ -351,12 +610,13 @@ class Cluster:
             if node is None:
                 node = self._psudo_node(host)
             else:
-                node = deepcopy(node)
+                node = self.node_to_dict(node)
             
             for gpu in node['gpus']:
                 if self.add_calendar:
                     gpu['calendar'] = self.get_gpu_calendar(host, gpu['index'])
-                gpu_illegal = [proc['username'] for proc in gpu['users'] if proc['user_code']]
+                gpu_illegal = [proc['username'] for proc in gpu['users'] 
+                               if proc.get('user_code')]
                 illegal_users.update(gpu_illegal)
 
             node['version'] = node['gpus'][0]['name'] if node['gpus'] else ''
@@ -392,10 +652,15 @@ class Cluster:
 
     @property
     def calendar_status(self):
-        if self.calendar_dt and (time.time() - self.calendar_dt < 120):
-            return True
-        else:
-            return False
+        """Whether all calendars are fetched within the last 120 seconds"""
+        now = time.time()
+        return len(self.teamup_ids) > 0 and all(
+            now - self.calendar_fresh.get(tid, 0) < 120 for tid in self.teamup_ids)
+
+    @property
+    def calendar_stale(self):
+        """Whether some calendars are out of date, including bookings loaded from cache"""
+        return not self.calendar_status and len(self.bookings.bookings()) > 0
                     
 
 
@@ -5,22 +5,19 @@
 """
 API of server monitor.
 """
-import os
-import sys
-print('Add system path: {}'.format(os.getcwd()))
-sys.path.append(os.getcwd())
-
 import json
 import toml
 import re
 from collections import OrderedDict
 import time
 import argparse
+from html import escape
 
 from flask import Flask, request, jsonify, make_response
 
 from next_cluster.main.main_daemon import Cluster
 from next_cluster.utils.teamup import translate_next
+from next_cluster.utils.traffic import RecordBackend
 
 def main():
     parser = argparse.ArgumentParser(description='GPU Cluster Monitor API')
@@ -43,7 +40,14 @@ def main():
         node_wait = config.get('node_wait'),
         node_expire_time = config.get('node_expire_time'),
         cal_wait = config.get('cal_wait'), # calendar referesh interval
-        dur_book_update = config.get('dur_book_update') # interval to refersh status
+        dur_book_update = config.get('dur_book_update'), # interval to refersh status
+        adaptive_poll = config.get('adaptive_poll', True),
+        cache_file = config.get('cache_file'), # persist status across restarts
+        cache_wait = config.get('cache_wait', 30),
+        teamup_rate = config.get('teamup_rate', 1), # requests per second to Teamup
+        teamup_burst = config.get('teamup_burst', 2),
+        # record fetched traffic to replay offline with next_cluster.main.replay
+        backend = RecordBackend(config['record_file']) if config.get('record_file') else None
     )
 
     app = build_app(next_server)
@@ -81,8 +85,26 @@ def build_app(next_server):
 
     @app.route('/bookings', methods = ['GET'])
     def get_user_status():
-        data = next_server.book_df.to_html()
-        return data
+        """
+        Query bookings. Parameters: user, host, gpu, day, page, page_size.
+        Return JSON by default and a html table with `format=html`.
+        """
+        args = request.args
+        result = next_server.query_bookings(
+            user = args.get('user'),
+            host = args.get('host'),
+            gpu = args.get('gpu', type = int),
+            day = args.get('day', type = int),
+            page = args.get('page', 1, type = int),
+            page_size = min(args.get('page_size', 50, type = int), 1000)
+        )
+        if args.get('format') == 'html':
+            return render_bookings(result)
+        return jsonify(result)
+
+    @app.route('/poll-schedule', methods = ['GET'])
+    def get_poll_schedule():
+        return jsonify(next_server.get_poll_schedule())
 
     @app.route('/refresh-user', methods = ['GET'])
     def referesh_user():
@@ -95,6 +117,17 @@ def build_app(next_server):
     
     return app
 
+def render_bookings(result):
+    """Render one page of bookings into a html table"""
+    cols = ['title', 'who', 'day', 'hostname', 'index', 'code']
+    lines = ['<p>Total: {total}, page {page} ({page_size} per page)</p>'.format(**result),
+             '<table border="1">',
+             '<tr>' + ''.join(f'<th>{k}</th>' for k in cols) + '</tr>']
+    for row in result['bookings']:
+        lines.append('<tr>' + ''.join(f'<td>{escape(str(row[k]))}</td>' for k in cols) + '</tr>')
+    lines.append('</table>')
+    return '\n'.join(lines)
+
 if __name__ == '__main__':
     main()
     
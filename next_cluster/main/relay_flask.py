@@ -0,0 +1,84 @@
+"""
+Relay daemon to aggregate the status of a subset of nodes, e.g., one rack.
+
+The relay polls its nodes with the same machinery as the main `Cluster` and
+exposes the merged node list via `/get-status` as a node client does,
+so that the main node polls relays instead of every node.
+
+Relay status format:
+    relay: nickname of the relay
+    last_update
+    nodes: dict from node nickname to node data (None if never reached)
+"""
+from argparse import ArgumentParser
+import toml
+import logging
+import json
+from datetime import datetime
+
+from flask import Flask, request, jsonify, abort
+
+from next_cluster.main.main_daemon import Cluster
+
+class RelayCluster(Cluster):
+    """Only fetch node status. Booking check is left to the main node."""
+
+    def __init__(self, host_data, name = 'relay', **kwargs):
+        self.name = name
+        super().__init__(host_data, add_calendar = False, **kwargs)
+
+    def daemon_check_and_update(self):
+        """No booking check in relay"""
+        return
+
+    def get_status(self):
+        with self.lock:
+            nodes = {host: self.node_to_dict(node) if node is not None else None
+                     for host, node in self.nodes.items()}
+        return {'relay': self.name,
+                'last_update': datetime.now().isoformat(),
+                'nodes': nodes}
+
+def build_app(relay: RelayCluster, passwd):
+    app = Flask(__name__)
+
+    @app.route('/get-status', methods = ['POST'])
+    def relay_status():
+        pw = request.json.get('passwd', None)
+        if passwd is None or pw == passwd:
+            return jsonify(relay.get_status())
+        else:
+            abort(404)
+
+    @app.route('/poll-schedule', methods = ['GET'])
+    def get_poll_schedule():
+        return jsonify(relay.get_poll_schedule())
+
+    return app
+
+def main():
+    parser = ArgumentParser(description='Relay to aggregate status of a subset of nodes')
+    parser.add_argument('--config', '-c', help = 'toml config file',
+                        default = 'config.toml')
+    args = parser.parse_args()
+    config = toml.load(args.config)['relay']
+
+    print(json.dumps(config, indent = 4))
+
+    relay = RelayCluster(
+        config['host_data'],
+        name = config.get('name', 'relay'),
+        port = config.get('client_port'),
+        passwd = config.get('passwd'),
+        node_wait = config.get('node_wait'),
+        node_expire_time = config.get('node_expire_time'),
+        adaptive_poll = config.get('adaptive_poll', True)
+    )
+
+    app = build_app(relay, config.get('passwd'))
+    log = logging.getLogger('werkzeug')
+    log.setLevel(logging.WARNING)
+    app.run(host = '0.0.0.0', port = config['port'], threaded = True)
+
+if __name__ == '__main__':
+    main()
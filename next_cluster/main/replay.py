@@ -0,0 +1,169 @@
+"""
+Replay recorded node and Teamup traffic through `Cluster` offline.
+
+Record the traffic on the main node by setting `record_file` in the [main]
+section of config.toml (see `next_cluster.utils.traffic`). The replay builds
+a `Cluster` from the same config without fetching threads, feeds the records
+in time order and refreshes the status every `dur_book_update` seconds of
+recorded time, as the check thread does. The window of bookings and the
+expiry of nodes follow the recorded time. User codes are checked against the
+recorded user list of the main node, or the file given by `--user_list`.
+
+A recorder writes a new gzip file on each start. Give all files of the
+recording, in any order. They are replayed in the order of their records.
+
+It reports the time spent in refreshing the status and in `assemble`, so that
+throughput can be compared between versions on production-shaped data.
+
+Usage:
+    python -m next_cluster.main.replay traffic.jsonl.gz -c config.toml
+    python -m next_cluster.main.replay traffic.jsonl.gz --speed 1 # real time
+    python -m next_cluster.main.replay traffic.jsonl.gz --profile replay.prof
+    python -m next_cluster.main.replay traffic.jsonl.gz --user_list user_list.txt
+    python -m next_cluster.main.replay traffic*.jsonl.gz # several runs of the recorder
+"""
+import time
+import json
+import argparse
+import statistics
+from datetime import datetime
+from typing import Dict, Any, List, Union, Iterator
+
+import toml
+
+from next_cluster.main.main_daemon import Cluster
+from next_cluster.utils.teamup import local_today
+from next_cluster.utils.traffic import read_records, first_time, bookings_from_list
+
+def _summary(times: List[float]) -> Dict[str, float]:
+    if not times:
+        return {'count': 0}
+    return {'count': len(times),
+            'mean_ms': statistics.mean(times) * 1000,
+            'p50_ms': statistics.median(times) * 1000,
+            'max_ms': max(times) * 1000}
+
+def _read_all(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    for path in sorted(paths, key = first_time):
+        yield from read_records(path)
+
+def replay(path: Union[str, List[str]], cluster: Cluster, speed: float = 0., 
+           recorded_users: bool = True) -> Dict[str, Any]:
+    """
+    Feed records into the cluster. Return timing statistics.
+
+    Args:
+        path: record file, or files of several runs of the recorder.
+        speed: 1 to replay in real time, 2 for twice as fast. 0 for maximum speed.
+        recorded_users: whether to use the recorded user list instead of 
+            the one of the cluster.
+    """
+    hosts = {h['nickname']: h for h in cluster.host_data}
+    update_times = []
+    assemble_times = []
+
+    assemble = cluster.assemble
+    def timed_assemble():
+        start = time.perf_counter()
+        status = assemble()
+        assemble_times.append(time.perf_counter() - start)
+        return status
+    cluster.assemble = timed_assemble
+
+    def timed_update():
+        start = time.perf_counter()
+        cluster.update_status()
+        update_times.append(time.perf_counter() - start)
+
+    t0 = None # recorded time of the first record
+    t1 = None # recorded time of the last record
+    wall0 = time.perf_counter()
+    last_update = None
+    n_records = 0
+    n_applied = 0 # records in the status of the last refresh
+    paths = [path] if isinstance(path, str) else list(path)
+    for rec in _read_all(paths):
+        if t0 is None:
+            t0 = rec['t']
+            last_update = rec['t']
+        if speed > 0:
+            delay = (rec['t'] - t0) / speed - (time.perf_counter() - wall0)
+            if delay > 0:
+                time.sleep(delay)
+        n_records += 1
+        t1 = rec['t']
+        today = local_today(rec['t']).date()
+        cluster.bookings.clock = lambda: today
+
+        data = rec['data']
+        if rec['kind'] == 'node':
+            if rec['key'] in hosts:
+                cluster.apply_node_data(hosts[rec['key']], data, 
+                                        datetime.fromtimestamp(rec['t']))
+        elif rec['kind'] == 'calendar_map':
+            if data is not None:
+                cluster.subcal_maps[rec['key']] = data
+        elif rec['kind'] == 'bookings':
+            if data is not None and rec['key'] in cluster.teamup_ids:
+                cluster.apply_bookings(rec['key'], bookings_from_list(data))
+        elif rec['kind'] == 'users':
+            if recorded_users:
+                cluster.set_users(data)
+
+        if rec['t'] - last_update >= cluster.dur_book_update:
+            last_update = rec['t']
+            timed_update()
+            n_applied = n_records
+
+    if n_records > n_applied:
+        # records after the last refresh
+        timed_update()
+
+    wall = time.perf_counter() - wall0
+    return {'records': n_records,
+            'recorded_seconds': (t1 - t0) if t0 is not None else 0,
+            'wall_seconds': wall,
+            'records_per_second': n_records / wall if wall > 0 else None,
+            'update_status': _summary(update_times),
+            'assemble': _summary(assemble_times)}
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Replay recorded traffic through Cluster')
+    parser.add_argument('record_file', nargs = '+', 
+                        help = 'files recorded with main.record_file')
+    parser.add_argument('--config', '-c', help = 'toml config file',
+                        default = 'config.toml')
+    parser.add_argument('--speed', type = float, default = 0,
+                        help = '1 for real time, 0 for maximum speed')
+    parser.add_argument('--profile', help = 'save cProfile stats to this file')
+    parser.add_argument('--user_list', help = 'user list file instead of the recorded one')
+    args = parser.parse_args()
+    config = toml.load(args.config)['main']
+
+    cluster = Cluster(
+        config['host_data'],
+        port = config.get('client_port'),
+        passwd = config.get('passwd'),
+        add_calendar = config['add_calendar'],
+        user_list = args.user_list or 'user_list.txt',
+        teamup_ids = config.get('teamup_ids'),
+        num_days = config.get('num_days'),
+        node_wait = config.get('node_wait'),
+        node_expire_time = config.get('node_expire_time'),
+        dur_book_update = config.get('dur_book_update'),
+        adaptive_poll = config.get('adaptive_poll', True),
+        run_daemon = False
+    )
+
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        stats = profiler.runcall(replay, args.record_file, cluster, args.speed,
+                                args.user_list is None)
+        profiler.dump_stats(args.profile)
+    else:
+        stats = replay(args.record_file, cluster, args.speed, args.user_list is None)
+    print(json.dumps(stats, indent = 4))
+
+if __name__ == '__main__':
+    main()
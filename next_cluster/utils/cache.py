@@ -0,0 +1,40 @@
+"""
+Persist the state of the main daemon to disk so that it survives restarts.
+
+The state is a JSON-serializable dict saved as gzip-compressed JSON.
+Writes go to a temporary file that then replaces the cache file,
+so a crash never leaves a partially written cache.
+"""
+import os
+import gzip
+import json
+import tempfile
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+def save_state(path: str, state: Dict[str, Any]):
+    """Atomically write state to path"""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir = path.parent, prefix = path.name, suffix = '.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with gzip.GzipFile(fileobj = f, mode = 'wb', compresslevel = 5) as gz:
+                gz.write(json.dumps(state, separators = (',', ':')).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def load_state(path: str) -> Optional[Dict[str, Any]]:
+    """Return the saved state, or None if there is no valid cache"""
+    if not Path(path).exists():
+        return None
+    try:
+        with gzip.open(path, 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except Exception as e:
+        print(f'Fail to load cache {path}: {repr(e)}')
+        return None
@@ -1,36 +1,16 @@
 """GPU status and occupied process information"""
 import pynvml as N
-from dataclasses import dataclass, field
-from typing import List, Union, Dict, Optional, Any, Tuple
+from typing import List, Union, Dict, Optional, Any, Tuple, Iterable, Iterator
+import os
 import subprocess
-import pandas as pd
+import signal
+import time
+from threading import Timer, Lock
+from collections import deque
+from datetime import datetime
 import psutil
 
-@dataclass
-class GPU_STAT:
-    index: int
-    name: str # GPU Brand name, e.g., NVIDIA RTX 3090
-    use_mem: int # Used memory in MiB
-    tot_mem: int # Total memory in MiB
-    utilize: int # utilization percentage, e.g., 80 for 80% utilization
-    temp: int # GPU Temperature
-    users: List[Dict[str, Any]] = field(default_factory=list) 
-    # Each element is a process information dict
-
-    def __post_init__(self):
-        # Change str type to int
-        for key in ['index', 'use_mem', 'tot_mem', 'utilize', 'temp']:
-            self.__dict__[key] = int(self.__dict__[key])
-    
-    def __getitem__(self, key):
-        return self.__dict__[key]
-
-    def __setitem__(self, key, value):
-        self.__dict__[key] = value
-    
-    def to_dict(self):
-        return self.__dict__
-
+from next_cluster.utils.records import GPU_STAT, GPU_PROC
 
 def get_gpu_stat()->List[GPU_STAT]:
     """Use pynvml to get all GPUs status."""
@@ -56,6 +36,114 @@ def get_gpu_stat()->List[GPU_STAT]:
     N.nvmlShutdown()
     return gpus
 
+def _proc_util(handle, state: Dict[str, Any]) -> Dict[int, int]:
+    """SM utilization of each process since the last call"""
+    try:
+        samples = N.nvmlDeviceGetProcessUtilization(handle, state.get('last_ts', 0))
+    except N.NVMLError_NotFound: # no new samples
+        return {}
+    if samples:
+        state['last_ts'] = max(s.timeStamp for s in samples)
+    return {s.pid: int(s.smUtil) for s in samples}
+
+# Telemetry fields: name -> (NVML field id name, function of (handle, state), scale)
+# Fields with a field id are queried together by nvmlDeviceGetFieldValues if
+# the NVML library supports it. Otherwise the function is called.
+TELEMETRY_FIELDS = {
+    'power': ('NVML_FI_DEV_POWER_INSTANT', 
+              lambda h, st: N.nvmlDeviceGetPowerUsage(h), 1e-3), # Watt
+    'power_limit': (None, lambda h, st: N.nvmlDeviceGetEnforcedPowerLimit(h), 1e-3),
+    'sm_clock': (None, lambda h, st: N.nvmlDeviceGetClockInfo(h, N.NVML_CLOCK_SM), 1), # MHz
+    'mem_clock': (None, lambda h, st: N.nvmlDeviceGetClockInfo(h, N.NVML_CLOCK_MEM), 1),
+    'pcie_tx': (None, lambda h, st: N.nvmlDeviceGetPcieThroughput(
+                    h, N.NVML_PCIE_UTIL_TX_BYTES), 1), # KB/s
+    'pcie_rx': (None, lambda h, st: N.nvmlDeviceGetPcieThroughput(
+                    h, N.NVML_PCIE_UTIL_RX_BYTES), 1),
+    'ecc_errors': ('NVML_FI_DEV_ECC_DBE_VOL_TOTAL', 
+                   lambda h, st: N.nvmlDeviceGetTotalEccErrors(
+                       h, N.NVML_MEMORY_ERROR_TYPE_UNCORRECTED, N.NVML_VOLATILE_ECC), 1),
+    'proc_util': (None, _proc_util, None), # pid -> SM utilization percent
+}
+
+def _field_value(v) -> Optional[float]:
+    """Read the value of c_nvmlFieldValue_t according to its type"""
+    attr = {0: 'dVal', 1: 'uiVal', 2: 'ulVal', 3: 'ullVal', 4: 'sllVal', 5: 'siVal'}.get(v.valueType)
+    # None for types unknown to this version, or to the pynvml in use
+    return getattr(v.value, attr, None) if attr else None
+
+class GPUTelemetry:
+    """
+    Collect extra telemetry of all gpus in one pass with cached NVML handles.
+
+    Args:
+        fields: map from field name in `TELEMETRY_FIELDS` to its refresh interval (seconds).
+            A field is collected by `collect` only when its interval has passed.
+    
+    Fields not supported by a gpu are skipped afterwards.
+    """
+    def __init__(self, fields: Dict[str, float]):
+        unknown = set(fields) - set(TELEMETRY_FIELDS)
+        if unknown:
+            raise ValueError(f'Unknown telemetry fields: {sorted(unknown)}')
+        self.fields = fields
+        self.values: Dict[int, Dict[str, Any]] = {} # gpu index -> field -> value
+        self._next: Dict[str, float] = {k: 0. for k in fields}
+        self._state: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        self._unsupported = set() # (gpu index, field)
+        N.nvmlInit()
+        self._handles = [N.nvmlDeviceGetHandleByIndex(i) 
+                         for i in range(N.nvmlDeviceGetCount())]
+        self._field_ids = {k: getattr(N, TELEMETRY_FIELDS[k][0], None) 
+                           for k in fields if TELEMETRY_FIELDS[k][0]}
+        self._field_ids = {k: v for k, v in self._field_ids.items() if v is not None}
+        if not hasattr(N, 'nvmlDeviceGetFieldValues'):
+            self._field_ids = {}
+
+    @property
+    def interval(self) -> float:
+        """Interval to call `collect`"""
+        return min(self.fields.values())
+
+    def collect(self) -> Dict[int, Dict[str, Any]]:
+        """Update due fields and return the values of all fields"""
+        now = time.monotonic()
+        due = [k for k in self.fields if self._next[k] <= now]
+        for k in due:
+            self._next[k] = now + self.fields[k]
+        batch = [k for k in due if k in self._field_ids]
+
+        values = {}
+        for idx, handle in enumerate(self._handles):
+            gpu_values = dict(self.values.get(idx, {}))
+            todo = [k for k in due if (idx, k) not in self._unsupported]
+            batch_k = [k for k in batch if k in todo]
+            if batch_k:
+                try:
+                    results = N.nvmlDeviceGetFieldValues(
+                        handle, [self._field_ids[k] for k in batch_k])
+                except N.NVMLError:
+                    results = [] # fall back to function calls
+                for k, r in zip(batch_k, results):
+                    v = _field_value(r) if r.nvmlReturn == 0 else None
+                    # otherwise fall back to the function call
+                    if v is not None:
+                        gpu_values[k] = v * TELEMETRY_FIELDS[k][2]
+                        todo.remove(k)
+            for k in todo:
+                _, func, scale = TELEMETRY_FIELDS[k]
+                try:
+                    v = func(handle, self._state.setdefault((idx, k), {}))
+                except N.NVMLError_NotSupported:
+                    self._unsupported.add((idx, k))
+                    v = None
+                except N.NVMLError as e:
+                    print(f'Fail to get {k} of gpu {idx}: {repr(e)}')
+                    v = None
+                gpu_values[k] = v * scale if (scale is not None and v is not None) else v
+            values[idx] = gpu_values
+        self.values = values
+        return values
+
 def get_gpu_serial()-> Dict[str, int]:
     """map from serial to index(int)"""
     ser_map = {}
@@ -83,48 +171,158 @@ def get_proc_info(pid) -> Tuple[str, str]:
         command = None
     return username, command
 
-def get_gpu_process(serial_map: Optional[Dict[str, int]])->Dict[int, List[Dict[str, Any]]]:
+def iter_command_lines(args: List[str], timeout: float = 10) -> Iterator[str]:
+    """
+    Run a command and yield its stdout lines as they are produced.
+
+    The output is consumed while the command runs, so a full pipe never blocks it.
+    Kill the command and raise `subprocess.TimeoutExpired` if it does not finish in time.
+    """
+    # run in a new process group to kill its children on timeout
+    p = subprocess.Popen(args, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL,
+                         close_fds = True, text = True, start_new_session = True)
+    def _kill():
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    timer = Timer(timeout, _kill)
+    timer.start()
+    try:
+        for line in p.stdout:
+            yield line
+        p.wait()
+    finally:
+        timer.cancel()
+        p.stdout.close()
+        if p.poll() is None:
+            _kill()
+            p.wait()
+    if p.returncode != 0:
+        if p.returncode == -signal.SIGKILL:
+            raise subprocess.TimeoutExpired(args, timeout)
+        raise subprocess.CalledProcessError(p.returncode, args)
+
+def parse_compute_apps(lines: Iterable[str], serial_map: Dict[str, int]
+) -> Dict[int, List[Tuple[int, int]]]:
+    """
+    Parse the output of `nvidia-smi --query-compute-apps=gpu_serial,pid,used_memory 
+    --format=csv,noheader,nounits` line by line.
+
+    Return:
+        gpu2procs: map from gpu index to a list of (pid, used memory in MiB)
+    """
+    gpu2procs = {}
+    for line in lines:
+        fields = line.split(',')
+        if len(fields) != 3:
+            continue
+        serial, pid, mem = [k.strip() for k in fields]
+        idx = serial_map.get(serial)
+        if idx is None or not pid.isdigit():
+            continue
+        # memory may be [N/A], e.g., in some containers
+        mem = int(mem) if mem.isdigit() else 0
+        gpu2procs.setdefault(idx, []).append((int(pid), mem))
+    return gpu2procs
+
+def get_gpu_process(serial_map: Optional[Dict[str, int]], timeout: float = 10
+)->Dict[int, List[GPU_PROC]]:
     """
     Use nvidia-smi command to get information of processes occupying GPUs.
 
     Args:
         serial_map: dict from gpu serial number to gpu index. 
             It is usually provided to avoid repeatly getting it. If not, get it.
+        timeout: seconds to wait for nvidia-smi
     """
-    command = 'nvidia-smi --query-compute-apps=gpu_serial,pid,used_memory --format=csv'
+    args = ['nvidia-smi', '--query-compute-apps=gpu_serial,pid,used_memory',
+            '--format=csv,noheader,nounits']
 
     if serial_map is None:
         serial_map = get_gpu_serial()
     
-    # Consistantly run the command.
-    while True:
-        try:
-            p = subprocess.Popen(command, shell=True, close_fds=True, bufsize=-1,
-                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            # To avoid frequent query with nvidia-smi, set a waiting time of 10 seconds
-            p.wait(10)
-            break
-        except:
-            continue
-    
-    df = pd.read_csv(p.stdout, dtype = str)
-    # columns: gpu_serial, pid, used_gpu_memory [MiB]
-    df.rename(lambda k: k.strip(), axis = 'columns', inplace = True)
-    # print(df.columns)
-
-    # Process columns
-    df['pid'] = df['pid'].astype(int)
-    df['idx'] = df['gpu_serial'].apply(lambda k: serial_map[k])
-    df['mem(MiB)'] = df['used_gpu_memory [MiB]'].apply(lambda k: int(k.split()[0]))
-
-    # Build a map from gpu index to a List of process status dicts
-    gpu2procs = df.groupby('idx')[['pid', 'mem(MiB)']].apply(
-                    lambda k: k.to_dict('records')).to_dict()
-    for procs in gpu2procs.values():
-        for proc in procs:
-            proc['username'], proc['command'] = get_proc_info(proc['pid'])
-    
-    new_gpu2procs = {idx:[p for p in procs if p['username']] for idx,procs in gpu2procs.items()}
+    gpu2procs = parse_compute_apps(iter_command_lines(args, timeout), serial_map)
+
+    new_gpu2procs = {}
+    for idx, procs in gpu2procs.items():
+        records = []
+        for pid, mem in procs:
+            username, command = get_proc_info(pid)
+            if username:
+                records.append(GPU_PROC(pid, username, mem, command))
+        new_gpu2procs[idx] = records
 
     return new_gpu2procs
 
+class GPUProcTracker:
+    """
+    Track gpu processes incrementally and record process start/stop events.
+
+    `poll` queries the compute processes of each device from NVML, which is 
+    much cheaper than running nvidia-smi. Only new pids are looked up for 
+    username and command. `check_exits` removes exited processes by checking
+    /proc, so it can run frequently between polls.
+    """
+    def __init__(self, max_events: int = 500):
+        self.procs: Dict[int, Dict[int, GPU_PROC]] = {} # gpu index -> pid -> process
+        self.events = deque(maxlen = max_events)
+        self._lock = Lock()
+        N.nvmlInit()
+        self._handles = [N.nvmlDeviceGetHandleByIndex(i) 
+                         for i in range(N.nvmlDeviceGetCount())]
+
+    def _event(self, event: str, idx: int, proc: GPU_PROC):
+        self.events.append({'time': datetime.now().isoformat(timespec = 'microseconds'),
+                            'event': event,
+                            'gpu': idx,
+                            'pid': proc.pid,
+                            'username': proc.username})
+
+    def poll(self) -> bool:
+        """Update processes from NVML. Return whether processes or their memory change."""
+        changed = False
+        with self._lock:
+            for idx, handle in enumerate(self._handles):
+                current = {}
+                for p in N.nvmlDeviceGetComputeRunningProcesses(handle):
+                    current[p.pid] = int((p.usedGpuMemory or 0) / 1024 / 1024)
+                tracked = self.procs.setdefault(idx, {})
+                for pid in [pid for pid in tracked if pid not in current]:
+                    self._event('stop', idx, tracked.pop(pid))
+                    changed = True
+                for pid, mem in current.items():
+                    if pid in tracked:
+                        if tracked[pid].mem != mem:
+                            tracked[pid].mem = mem
+                            changed = True
+                        continue
+                    username, command = get_proc_info(pid)
+                    if username:
+                        tracked[pid] = GPU_PROC(pid, username, mem, command)
+                        self._event('start', idx, tracked[pid])
+                        changed = True
+        return changed
+
+    def check_exits(self) -> bool:
+        """Remove processes that have exited. Return whether any process exits."""
+        changed = False
+        with self._lock:
+            for idx, tracked in self.procs.items():
+                for pid in [pid for pid in tracked if not os.path.exists(f'/proc/{pid}')]:
+                    self._event('stop', idx, tracked.pop(pid))
+                    changed = True
+        return changed
+
+    def snapshot(self) -> Dict[int, List[GPU_PROC]]:
+        """Return map from gpu index to processes, in the format of `get_gpu_process`"""
+        with self._lock:
+            return {idx: list(tracked.values()) for idx, tracked in self.procs.items()}
+
+    def get_events(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return events after the time `since` (isoformat)"""
+        with self._lock:
+            events = list(self.events)
+        if since is not None:
+            events = [e for e in events if e['time'] > since]
+        return events
@@ -0,0 +1,46 @@
+"""Thread-safe token bucket rate limiter"""
+import time
+from threading import Lock
+
+class TokenBucket:
+    """
+    Allow `rate` requests per second on average and bursts up to `capacity`.
+
+    Args:
+        rate: tokens added per second
+        capacity: maximum number of tokens
+    """
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if available. Return whether succeed."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1):
+        """
+        Block until tokens are available. 
+        
+        Tokens are reserved immediately, so waiting callers are served in 
+        arrival order and a frequent caller cannot starve the others.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
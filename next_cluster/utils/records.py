@@ -0,0 +1,120 @@
+"""
+Compact records of gpu status and gpu processes.
+
+Records use `__slots__` and intern repeated strings (username, command) so
+that the main node can hold the status of many nodes with little memory.
+They support dict-like item access and serialize to the JSON format of node status.
+"""
+import sys
+from typing import List, Dict, Any, Optional
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+class GPU_PROC:
+    """Information of a process occupying a gpu. Keys besides the fixed fields are kept in `extra`."""
+    __slots__ = ('pid', 'username', 'mem', 'command', 'user_code', 'extra')
+
+    # keys of the fixed fields in dict
+    FIELDS = ('pid', 'username', 'mem(MiB)', 'command', 'user_code')
+    # map from dict key to attribute name
+    KEY_MAP = {'mem(MiB)': 'mem'}
+
+    def __init__(self, pid, username, mem, command, user_code = None,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.pid = int(pid)
+        self.username = _intern(username)
+        self.mem = int(mem) # Used memory in MiB
+        self.command = _intern(command)
+        self.user_code = user_code # added by main node. 1 if user has no booking
+        self.extra = extra # e.g., util from gpu telemetry
+
+    def __getitem__(self, key):
+        key = self.KEY_MAP.get(key, key)
+        if key in self.__slots__:
+            return getattr(self, key)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        key = self.KEY_MAP.get(key, key)
+        if key in self.__slots__:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {'pid': self.pid,
+             'mem(MiB)': self.mem,
+             'username': self.username,
+             'command': self.command}
+        if self.user_code is not None:
+            d['user_code'] = self.user_code
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]):
+        extra = {k: v for k, v in d.items() if k not in cls.FIELDS}
+        return cls(d['pid'], d['username'], d['mem(MiB)'], d['command'],
+                   d.get('user_code'), extra = extra or None)
+
+class GPU_STAT:
+    """Status of a gpu. Keys besides the fixed fields are kept in `extra`."""
+    __slots__ = ('index', 'name', 'use_mem', 'tot_mem', 'utilize', 'temp',
+                 'users', 'extra')
+
+    FIELDS = ('index', 'name', 'use_mem', 'tot_mem', 'utilize', 'temp')
+
+    def __init__(
+            self,
+            index: int,
+            name: str, # GPU Brand name, e.g., NVIDIA RTX 3090
+            use_mem: int, # Used memory in MiB
+            tot_mem: int, # Total memory in MiB
+            utilize: int, # utilization percentage, e.g., 80 for 80% utilization
+            temp: int, # GPU Temperature
+            users: Optional[List[GPU_PROC]] = None, # process information
+            extra: Optional[Dict[str, Any]] = None
+        ):
+        self.index = int(index)
+        self.name = _intern(name)
+        self.use_mem = int(use_mem)
+        self.tot_mem = int(tot_mem)
+        self.utilize = int(utilize)
+        self.temp = int(temp)
+        self.users = users if users is not None else []
+        self.extra = extra
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.__slots__:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {k: getattr(self, k) for k in self.FIELDS}
+        d['users'] = [p.to_dict() for p in self.users]
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]):
+        extra = {k: v for k, v in d.items() if k not in cls.__slots__}
+        users = [GPU_PROC.from_dict(p) for p in d.get('users', [])]
+        return cls(*[d[k] for k in cls.FIELDS], users = users,
+                   extra = extra or None)
@@ -2,7 +2,7 @@
 Get teamup calendar and return booking recoreds in DataFrame.
 """
 
-from typing import Optional, Union, List, Dict, Tuple, Callable
+from typing import Optional, Union, List, Dict, Tuple, Callable, NamedTuple
 import requests
 import json
 from bs4 import BeautifulSoup
@@ -12,7 +12,21 @@ import pandas as pd
 import datetime
 import time
 
-def get_calendar_id(teamup_id: str) -> Dict[int, Tuple[str, str]]:
+from next_cluster.utils.ratelimit import TokenBucket
+
+TEAMUP_URL = 'https://teamup.com' # replace with a local server in tests
+
+class Booking(NamedTuple):
+    """Booking of one gpu over the dates [start, end)"""
+    title: str
+    who: str
+    hostname: str
+    index: int
+    start: datetime.date
+    end: datetime.date # exclusive
+
+def get_calendar_id(teamup_id: str, limiter: Optional[TokenBucket] = None
+) -> Dict[int, Tuple[str, str]]:
     """
     Get the map from Teamup subcalendar_id to a tuple of (node name, gpu idx).
 
@@ -20,13 +34,17 @@ def get_calendar_id(teamup_id: str) -> Dict[int, Tuple[str, str]]:
 
     Args:
         teamup_id: Teamup calendar id.
+        limiter: rate limiter shared by requests to Teamup
 
     Return:
         gpu_dt: a dict mapping subcalendar_id to [node, gpu_index]
             e.g., ["asus 4", "0"], ["dgx1 2", "7"]
     """
-    url = "https://teamup.com/{}".format(teamup_id)
-    page = requests.get(url)
+    url = "{}/{}".format(TEAMUP_URL, teamup_id)
+    if limiter is not None:
+        limiter.acquire()
+    page = requests.get(url, timeout = 10)
+    page.raise_for_status()
     soup = BeautifulSoup(page.text, 'html.parser')
     script_list = soup.find_all('script', src = None)
 
@@ -49,7 +67,8 @@ def get_calendar_id(teamup_id: str) -> Dict[int, Tuple[str, str]]:
 
     return gpu_dt
 
-def get_event(teamup_id: str, start_date:datetime.datetime, end_date:datetime.datetime
+def get_event(teamup_id: str, start_date:datetime.datetime, end_date:datetime.datetime,
+              limiter: Optional[TokenBucket] = None
 )->List[dict]:
     """
     Get bookings during the time span of [start_date, end_date].
@@ -59,21 +78,26 @@ def get_event(teamup_id: str, start_date:datetime.datetime, end_date:datetime.da
     Args:
         teamup_id: Teamup calendar id
         start_date, end_date: should have the method of strftime
+        limiter: rate limiter shared by requests to Teamup
 
     Return:
         event_list: a list of event. Each event is a dict of:
             gpu_ids: a list of subcalendar_ids
             user: a tuple of (title, who)
             range: [start_day, end_day +1] (offset to start_date)
+            dates: [start_date, end_date + 1 day] (`datetime.date`, not clipped)
     """
     web_fmt = '%Y-%m-%d'
-    url = 'https://teamup.com/{}/events'.format(teamup_id)
+    url = '{}/{}/events'.format(TEAMUP_URL, teamup_id)
     payload = {
         'startDate': start_date.strftime(web_fmt),
         'endDate': end_date.strftime(web_fmt),
         'tz': 'Asia/Shanghai'
     }
-    r = requests.get(url, params = payload)
+    if limiter is not None:
+        limiter.acquire()
+    r = requests.get(url, params = payload, timeout = 10)
+    r.raise_for_status() # e.g., 429 Too Many Requests
     my_event = []
     for event in r.json()['events']:
         d = {}
@@ -84,6 +108,7 @@ def get_event(teamup_id: str, start_date:datetime.datetime, end_date:datetime.da
         offset_start = max((e_start - start_date).days, 0)
         offset_end = min((e_end - start_date).days, (end_date - start_date).days)
         d['range'] = [offset_start, offset_end+1]
+        d['dates'] = [e_start.date(), e_end.date() + datetime.timedelta(days = 1)]
         my_event.append(d)
     return my_event
 
@@ -111,8 +136,18 @@ def get_micro_events(teamup_id: str,
     book_df['day'] = book_df['day'].astype(int)
     return book_df
 
+def local_today(timestamp: Optional[float] = None) -> datetime.datetime:
+    """Return the start of today, or of the day of a unix timestamp, in the calendar time zone."""
+    # customize your time zone here.
+    singapore_zone = datetime.timezone(datetime.timedelta(hours = 8))
+    if timestamp is None:
+        timestamp = time.time()
+    now = datetime.datetime.fromtimestamp(timestamp, singapore_zone)  # local current time
+    return datetime.datetime(now.year, now.month, now.day)
+
 def get_bookings(teamup_id: str, time_span: int = 7, 
-                 translate: Optional[Callable] = None
+                 translate: Optional[Callable] = None,
+                 subcalendar_to_gpu: Optional[Dict[int, Tuple[str, str]]] = None
                  ) -> Tuple[pd.DataFrame, List[str]]:
     """
     Return micro bookings:
@@ -121,14 +156,16 @@ def get_bookings(teamup_id: str, time_span: int = 7,
         - day
         - hostname: (`str`)
         - index: (`int`)
+
+    Args:
+        subcalendar_to_gpu: result of `get_calendar_id`. 
+            Provide it to avoid scraping the calendar page on each call.
+            Raise KeyError if a booking is on an unknown subcalendar.
     """
-    subcalendar_to_gpu = get_calendar_id(teamup_id)
+    if subcalendar_to_gpu is None:
+        subcalendar_to_gpu = get_calendar_id(teamup_id)
 
-    # customize your time zone here.
-    singapore_zone = datetime.timezone(datetime.timedelta(hours = 8))
-    utc_time = datetime.datetime.utcnow().replace(tzinfo = datetime.timezone.utc)
-    now = utc_time.astimezone(singapore_zone)  # local current time
-    now = datetime.datetime(now.year, now.month, now.day)
+    now = local_today()
     book_df = get_micro_events(teamup_id, now, now + datetime.timedelta(days=time_span-1))
 
     # convert calendar_gpu_id to hostname and index
@@ -146,6 +183,47 @@ def get_bookings(teamup_id: str, time_span: int = 7,
     date_list = [(now + datetime.timedelta(days=i)).strftime('%Y %m %d') for i in range(time_span)]
     return book_df, date_list
 
+def get_gpu_bookings(teamup_id: str,
+                     start_date: datetime.datetime,
+                     end_date: datetime.datetime,
+                     translate: Optional[Callable] = None,
+                     subcalendar_to_gpu: Optional[Dict[int, Tuple[str, str]]] = None,
+                     limiter: Optional[TokenBucket] = None
+                     ) -> List[Booking]:
+    """
+    Return bookings overlapping <start_date, end_date>, one for each booked gpu.
+
+    Dates are absolute, so bookings are not affected by the day change.
+    Raise KeyError if a booking is on a subcalendar not in `subcalendar_to_gpu`.
+    """
+    if subcalendar_to_gpu is None:
+        subcalendar_to_gpu = get_calendar_id(teamup_id, limiter)
+    
+    bookings = []
+    for event in get_event(teamup_id, start_date, end_date, limiter):
+        title, who = event['user']
+        who = who or ''
+        start, end = event['dates']
+        for gpu_id in event['gpu_ids']:
+            node, index = subcalendar_to_gpu[gpu_id]
+            if translate is not None:
+                node = translate(node)
+            bookings.append(Booking(title, who, node, int(index), start, end))
+    return bookings
+
+def split_who(who: str) -> List[str]:
+    """
+    Split the `who` field of a booking into usernames.
+    Usernames are separated by commas, semicolons, 、 or whitespace.
+
+    Example:
+        "cat, dog" -> ["cat", "dog"]
+        "cat dog;fox" -> ["cat", "dog", "fox"]
+    """
+    if not isinstance(who, str):
+        return []
+    return [k for k in re.split(r'[\s,，;；、]+', who) if k]
+
 # Utilities for NExT
 # Customize this function to map teamup node name to node hostname,
 # if they are not identical.
@@ -0,0 +1,201 @@
+"""
+Fetch backends of the main daemon and recording of the fetched traffic.
+
+`LiveBackend` fetches node status and Teamup calendars over the network.
+`RecordBackend` wraps another backend and appends each response with its
+time to a file, so that the traffic of a production cluster can be replayed
+offline by `next_cluster.main.replay`.
+
+The record file has one JSON object per line (gzip-compressed if the file
+name ends with .gz). A recorder killed before closing the file leaves the
+gzip stream unfinished, so each run records to a new gzip file: if the file
+exists, the time of the start is added to the name, e.g.,
+traffic.20240101-120000.jsonl.gz. A plain file is appended to. Each record is:
+    t: unix time of the response
+    kind: "node", "calendar_map", "bookings" or "users"
+    key: host nickname or teamup id. Empty for "users"
+    data: the response, or the user list of the main node. null if the fetch fails
+    error: repr of the exception if the fetch fails
+"""
+import os
+import gzip
+import json
+import time
+import zlib
+import datetime
+from threading import Lock
+from pathlib import Path
+from typing import Optional, Dict, List, Any, Callable, Iterator
+
+import requests
+
+from next_cluster.utils.teamup import Booking, get_gpu_bookings, get_calendar_id
+from next_cluster.utils.ratelimit import TokenBucket
+
+def bookings_to_list(bookings: List[Booking]) -> List[List]:
+    """Serialize bookings to JSON-compatible lists"""
+    return [[bk.title, bk.who, bk.hostname, bk.index, bk.start.isoformat(), bk.end.isoformat()]
+            for bk in bookings]
+
+def bookings_from_list(rows: List[List]) -> List[Booking]:
+    return [Booking(title, who, host, index,
+                    datetime.date.fromisoformat(start), datetime.date.fromisoformat(end))
+            for title, who, host, index, start, end in rows]
+
+class LiveBackend:
+    """Fetch from nodes and Teamup over the network"""
+
+    def fetch_node(self, host_d: dict, port: int, passwd: Optional[str]) -> dict:
+        res = requests.post(f'http://{host_d["ip"]}:{port}/get-status',
+                            json = {'passwd': passwd},
+                            timeout = 3)
+        return res.json()
+
+    def fetch_calendar_map(self, teamup_id: str, limiter: Optional[TokenBucket] = None
+    ) -> Dict[int, List]:
+        return get_calendar_id(teamup_id, limiter)
+
+    def fetch_bookings(self, teamup_id: str,
+                       start_date: datetime.datetime,
+                       end_date: datetime.datetime,
+                       translate: Optional[Callable] = None,
+                       subcalendar_to_gpu: Optional[Dict[int, List]] = None,
+                       limiter: Optional[TokenBucket] = None) -> List[Booking]:
+        return get_gpu_bookings(teamup_id, start_date, end_date, translate,
+                                subcalendar_to_gpu, limiter)
+
+def new_record_path(path: str) -> str:
+    """Return `path`, or `path` with the current time in the name if it exists"""
+    path = Path(path)
+    if not path.exists():
+        return str(path)
+    stem, dot, ext = path.name.partition('.')
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    new_path = path.with_name(f'{stem}.{stamp}{dot}{ext}')
+    if new_path.exists():
+        new_path = path.with_name(f'{stem}.{stamp}-{os.getpid()}{dot}{ext}')
+    return str(new_path)
+
+class RecordBackend:
+    """
+    Record responses of another backend to a file.
+
+    Args:
+        path: record file. A gzip file (.gz) that exists is kept and records 
+            go to a new file, see `new_record_path`. Records are appended to 
+            a plain file.
+        backend: the backend to record. Default to `LiveBackend`
+    """
+    def __init__(self, path: str, backend = None):
+        if str(path).endswith('.gz'):
+            path = new_record_path(path)
+            self._file = gzip.open(path, 'wt', encoding = 'utf-8')
+        else:
+            self._file = open(path, 'at', encoding = 'utf-8')
+        print(f'Record traffic to {path}')
+        self.path = path
+        self.backend = backend if backend is not None else LiveBackend()
+        self._lock = Lock()
+
+    def _record(self, kind: str, key: str, func: Callable, *args,
+                to_json: Callable = lambda x: x):
+        try:
+            data = func(*args)
+        except Exception as e:
+            self.write(kind, key, None, repr(e))
+            raise
+        self.write(kind, key, to_json(data))
+        return data
+
+    def write(self, kind: str, key: str, data: Any, error: Optional[str] = None):
+        rec = {'t': time.time(), 'kind': kind, 'key': key, 'data': data}
+        if error is not None:
+            rec['error'] = error
+        line = json.dumps(rec, separators = (',', ':'), ensure_ascii = False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def record_users(self, users: List[str]):
+        """Record the user list, as the replay may run on a machine with other users"""
+        self.write('users', '', list(users))
+
+    def fetch_node(self, host_d: dict, port: int, passwd: Optional[str]) -> dict:
+        return self._record('node', host_d['nickname'], self.backend.fetch_node,
+                            host_d, port, passwd)
+
+    def fetch_calendar_map(self, teamup_id: str, limiter: Optional[TokenBucket] = None):
+        return self._record('calendar_map', teamup_id, self.backend.fetch_calendar_map,
+                            teamup_id, limiter)
+
+    def fetch_bookings(self, teamup_id: str, *args, **kwargs) -> List[Booking]:
+        return self._record('bookings', teamup_id,
+                            lambda: self.backend.fetch_bookings(teamup_id, *args, **kwargs),
+                            to_json = bookings_to_list)
+
+def _gzip_lines(path: str, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    """
+    Lines of a gzip file, up to where the data is broken. A recorder killed
+    before closing the file leaves a stream without its end, and an older
+    recorder appended a new stream after it. The flushed lines before are kept.
+    """
+    decomp = zlib.decompressobj(wbits = 31)
+    rest = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            saved = decomp.copy()
+            try:
+                decomp, data = _decompress(decomp, chunk)
+                broken = False
+            except zlib.error:
+                # keep the data before the broken byte
+                decomp, data, broken = saved, b'', True
+                for i in range(len(chunk)):
+                    try:
+                        decomp, out = _decompress(decomp, chunk[i:i + 1])
+                    except zlib.error:
+                        break
+                    data += out
+            lines = (rest + data).split(b'\n')
+            rest = lines.pop()
+            yield from lines
+            if not chunk or broken:
+                break
+    # a partial last line is dropped by the JSON decoding
+
+def _decompress(decomp, data: bytes):
+    """Decompress data, continuing with a new decompressor at the next gzip stream"""
+    out = decomp.decompress(data)
+    while decomp.eof and decomp.unused_data:
+        unused = decomp.unused_data
+        decomp = zlib.decompressobj(wbits = 31)
+        out += decomp.decompress(unused)
+    return decomp, out
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate records of a record file. Records after the point where 
+    a killed recorder stopped are ignored.
+    """
+    if str(path).endswith('.gz'):
+        lines = _gzip_lines(path)
+    else:
+        lines = open(path, 'rb')
+    try:
+        for line in lines:
+            try:
+                rec = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # partially written line if the recorder was killed
+                continue
+            if rec['kind'] == 'calendar_map' and rec['data'] is not None:
+                # json keys are str
+                rec['data'] = {int(k): v for k, v in rec['data'].items()}
+            yield rec
+    finally:
+        lines.close()
+
+def first_time(path: str) -> float:
+    """Time of the first record of a record file. inf if the file has no record."""
+    return next((rec['t'] for rec in read_records(path)), float('inf'))
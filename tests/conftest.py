@@ -0,0 +1,36 @@
+"""Shared fixtures. NVML is never called in tests."""
+import sys
+import types
+from datetime import datetime
+
+import pytest
+
+try:
+    import pynvml
+except ImportError:
+    # tests replace NVML by a fake or do not call it
+    sys.modules['pynvml'] = types.ModuleType('pynvml')
+
+# users in the user list of test clusters
+USERS = ['alice', 'ann', 'anna', 'bob', 'bo']
+
+@pytest.fixture
+def user_list(tmp_path):
+    path = tmp_path / 'users.txt'
+    path.write_text('\n'.join(USERS) + '\n')
+    return str(path)
+
+def node_dict(host, usernames, t = None):
+    """Node status as sent by the node agent, with one gpu used by `usernames`"""
+    last_update = datetime.fromtimestamp(t) if t is not None else datetime.now()
+    return {'hostname': host,
+            'last_update': last_update.isoformat(),
+            'gpus': [{'index': 0, 'name': 'RTX', 'use_mem': 1, 'tot_mem': 2,
+                      'utilize': 3, 'temp': 4,
+                      'users': [{'pid': i, 'username': u, 'mem(MiB)': 5, 'command': ''}
+                                for i, u in enumerate(usernames)]}]}
+
+@pytest.fixture
+def make_node():
+    """Return `node_dict`"""
+    return node_dict
@@ -0,0 +1,125 @@
+"""BookingWindow against a brute-force recount, with a fake clock for day rollover"""
+import random
+import datetime
+from collections import defaultdict
+
+from next_cluster.utils.teamup import Booking
+from next_cluster.main.booking import (
+    BookingWindow, GOOD_BOOK, INVALID_BOOK_INFO, EXCEED_MAX_BOOK_GPU, EXCEED_MAX_BOOK_DAY
+)
+
+DAY0 = datetime.date(2024, 1, 1)
+
+class FakeClock:
+    def __init__(self):
+        self.today = DAY0
+
+    def __call__(self):
+        return self.today
+
+def random_bookings(rng, n):
+    bookings = []
+    for _ in range(n):
+        start = DAY0 + datetime.timedelta(days = rng.randint(-3, 15))
+        bookings.append(Booking(rng.choice(['ann', 'anna', 'bob', 'eve']), '',
+                                rng.choice(['h1', 'h2']), rng.randint(0, 2),
+                                start, start + datetime.timedelta(days = rng.randint(1, 5))))
+    return bookings
+
+def brute_force(calendars, start, num_days, max_gpu, max_day, users):
+    """Recount everything from scratch"""
+    dates = {start + datetime.timedelta(days = i) for i in range(num_days)}
+    days = defaultdict(set) # (title, host, index) -> dates
+    who_has = defaultdict(list) # (host, index, day) -> bookings
+    for bookings in calendars.values():
+        for bk in bookings:
+            d = bk.start
+            while d < bk.end:
+                if d in dates:
+                    days[(bk.title, bk.hostname, bk.index)].add(d)
+                    who_has[(bk.hostname, bk.index, (d - start).days)].append(bk)
+                d += datetime.timedelta(days = 1)
+    n_gpus = defaultdict(int)
+    for title, _, _ in days:
+        n_gpus[title] += 1
+    def code(bk):
+        if bk.title not in users:
+            return INVALID_BOOK_INFO
+        if n_gpus[bk.title] > max_gpu:
+            return EXCEED_MAX_BOOK_GPU
+        if len(days[(bk.title, bk.hostname, bk.index)]) > max_day:
+            return EXCEED_MAX_BOOK_DAY
+        return GOOD_BOOK
+    return days, n_gpus, who_has, code
+
+def check(window, calendars):
+    days, n_gpus, who_has, code = brute_force(
+        calendars, window.start, window.num_days,
+        window.max_gpu_per_user, window.max_days_per_gpu, window.users)
+    for user in ['ann', 'anna', 'bob', 'eve']:
+        assert window.n_gpus(user) == n_gpus[user]
+        for host in ['h1', 'h2']:
+            for index in range(3):
+                assert window.n_days(user, host, index) == len(days[(user, host, index)])
+    for host in ['h1', 'h2']:
+        for index in range(3):
+            for day in range(window.num_days):
+                expect = who_has[(host, index, day)]
+                got = window.who_has(host, index, day)
+                assert sorted(got) == sorted(expect)
+                assert [window.code(bk) for bk in sorted(got)] == \
+                       [code(bk) for bk in sorted(expect)]
+
+def test_rollover_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(300):
+        clock = FakeClock()
+        window = BookingWindow(5, 2, 3, users = ['ann', 'bob', 'eve'], clock = clock)
+        calendars = {}
+        for _ in range(6):
+            if rng.random() < 0.5:
+                cal_id = rng.choice(['cal1', 'cal2'])
+                calendars[cal_id] = random_bookings(rng, rng.randint(0, 8))
+                window.set_calendar(cal_id, calendars[cal_id])
+            else:
+                clock.today += datetime.timedelta(days = rng.randint(0, 3))
+                window.advance()
+            check(window, calendars)
+
+def test_advance_only_on_day_change():
+    clock = FakeClock()
+    window = BookingWindow(3, 4, 3, clock = clock)
+    version = window.version
+    assert not window.advance()
+    assert window.version == version
+    clock.today += datetime.timedelta(days = 1)
+    assert window.advance()
+    assert window.start == clock.today
+    assert window.version > version
+
+def test_booking_leaves_window():
+    clock = FakeClock()
+    window = BookingWindow(3, 4, 3, users = ['ann'], clock = clock)
+    window.set_calendar('cal', [Booking('ann', '', 'h1', 0, DAY0, DAY0 + datetime.timedelta(days = 2))])
+    assert window.n_days('ann', 'h1', 0) == 2
+    clock.today += datetime.timedelta(days = 1)
+    window.advance()
+    assert window.n_days('ann', 'h1', 0) == 1
+    clock.today += datetime.timedelta(days = 1)
+    window.advance()
+    assert window.n_days('ann', 'h1', 0) == 0
+    assert window.n_gpus('ann') == 0
+    assert window.rows() == []
+
+def test_identical_refetch_keeps_version():
+    clock = FakeClock()
+    window = BookingWindow(3, 4, 3, users = ['ann'], clock = clock)
+    bookings = random_bookings(random.Random(1), 10)
+    window.set_calendar('cal', bookings)
+    version = window.version
+    window.set_calendar('cal', list(bookings))
+    window.set_calendar('cal', list(reversed(bookings)))
+    assert window.version == version
+    window.set_calendar('cal', bookings[1:])
+    assert window.version == version + 1
+    check(window, {'cal': bookings[1:]})
@@ -0,0 +1,44 @@
+"""Saved state of the main daemon across restarts"""
+import datetime
+
+import pytest
+
+from next_cluster.main.main_daemon import Cluster
+from next_cluster.utils.cache import save_state, load_state
+from next_cluster.utils.teamup import Booking, local_today
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / 'cache.json.gz')
+
+def build(user_list, cache_file):
+    return Cluster([{'nickname': 'h1', 'ip': ''}], add_calendar = False, teamup_ids = ['cal'],
+                   user_list = user_list, cache_file = cache_file, run_daemon = False)
+
+def test_round_trip(user_list, cache_file):
+    today = local_today().date()
+    cluster = build(user_list, cache_file)
+    cluster.apply_bookings('cal', [Booking('ann', '', 'h1', 0, today,
+                                           today + datetime.timedelta(days = 1))])
+    save_state(cache_file, cluster.cache_state())
+    restored = build(user_list, cache_file)
+    assert restored.bookings.n_gpus('ann') == 1
+
+@pytest.mark.parametrize('state', [
+    # earlier format without a version
+    {'bookings': {}, 'nodes': {}},
+    {'version': Cluster.CACHE_VERSION + 1, 'bookings': {}},
+    # missing keys
+    {'version': Cluster.CACHE_VERSION, 'bookings': {}, 'nodes': {}},
+    # wrong shape
+    {'version': Cluster.CACHE_VERSION, 'bookings': {'cal': [['ann']]}, 'subcal_maps': {},
+     'relay_hosts': {}, 'nodes': {}},
+    ['not', 'a', 'dict'],
+])
+def test_invalid_cache_is_ignored(user_list, cache_file, state):
+    save_state(cache_file, state)
+    cluster = build(user_list, cache_file)
+    assert cluster.bookings.n_gpus('ann') == 0
+    assert cluster.nodes == {'h1': None}
+    assert cluster.subcal_maps == {}
+    assert load_state(cache_file) == state
@@ -0,0 +1,41 @@
+"""Collector of the node agent keeps running when a source fails"""
+import time
+
+from next_cluster.client.client_daemon import Collector
+
+def wait_for(cond, timeout = 5):
+    deadline = time.time() + timeout
+    while not cond() and time.time() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+def test_failing_callback_does_not_stop_collection():
+    collector = Collector()
+    values = []
+    def bad_callback(value):
+        raise RuntimeError('bad source')
+    bad = collector.register('bad', lambda: 1, 0.01, callback = bad_callback)
+    good = collector.register('good', lambda: len(values), 0.01, callback = values.append)
+    collector.start()
+    try:
+        assert wait_for(lambda: len(values) > 5)
+        # the failing source is rescheduled, but never counts as a successful run
+        n = len(values)
+        assert wait_for(lambda: len(values) > n + 5)
+        assert bad.last_run is None and good.last_run is not None
+    finally:
+        collector.stop()
+
+def test_failed_static_callback_is_retried():
+    collector = Collector()
+    calls = []
+    def callback(value):
+        calls.append(value)
+        if len(calls) == 1:
+            raise RuntimeError('first call fails')
+    src = collector.register('static', lambda: 'serial', 1, static = True, callback = callback)
+    collector.run_once()
+    collector.run_once()
+    collector.run_once()
+    assert calls == ['serial', 'serial']
+    assert src.value == 'serial'
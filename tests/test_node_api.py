@@ -0,0 +1,75 @@
+"""Node API: shared status body, ETag, auth and per-client rate limit"""
+import pytest
+
+from next_cluster.client import client_daemon, cli_flask
+from next_cluster.utils.records import GPU_STAT, GPU_PROC
+
+@pytest.fixture
+def node(monkeypatch):
+    monkeypatch.setattr(client_daemon, 'get_gpu_serial', lambda: {})
+    node = client_daemon.NodeStat(extra_keys = [])
+    node._set_gpus([GPU_STAT(0, 'RTX', 1, 2, 3, 4)])
+    node._set_procs({0: [GPU_PROC(1, 'ann', 5, 'python')]})
+    return node
+
+def test_status_shared_and_etag(node):
+    client = cli_flask.build_app(node, 'pw').test_client()
+    r1 = client.post('/get-status', json = {'passwd': 'pw'})
+    assert r1.get_json()['gpus'][0]['users'][0]['username'] == 'ann'
+    assert node.status_json()[1] is node.status_json()[1]
+    r2 = client.get('/status', headers = {'X-Auth-Token': 'pw'})
+    assert r2.headers['ETag'] == r1.headers['ETag']
+    r3 = client.get('/status', headers = {'X-Auth-Token': 'pw', 
+                                          'If-None-Match': r2.headers['ETag']})
+    assert r3.status_code == 304
+    node._set_procs({})
+    r4 = client.get('/status', headers = {'X-Auth-Token': 'pw', 
+                                          'If-None-Match': r2.headers['ETag']})
+    assert r4.status_code == 200
+
+def test_etag_differs_after_restart(node):
+    etag1 = cli_flask.build_app(node, None).test_client().post('/get-status', json = {}).headers['ETag']
+    etag2 = cli_flask.build_app(node, None).test_client().post('/get-status', json = {}).headers['ETag']
+    assert etag1 != etag2
+
+def test_auth(node):
+    client = cli_flask.build_app(node, 'pw').test_client()
+    assert client.post('/get-status', json = {'passwd': 'bad'}).status_code == 404
+    assert client.post('/get-status', json = {}).status_code == 404
+    assert client.get('/status', headers = {'X-Auth-Token': 'bad'}).status_code == 404
+
+def test_proc_events_auth(node):
+    client = cli_flask.build_app(node, 'pw').test_client()
+    # no JSON body is treated as no password, as for /get-status
+    assert client.post('/proc-events').status_code == 404
+    assert client.post('/proc-events', data = 'x').status_code == 404
+    assert client.post('/proc-events', json = {'passwd': 'pw'}).status_code == 200
+    client = cli_flask.build_app(node, None).test_client()
+    assert client.post('/proc-events').status_code == 200
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.
+
+    def monotonic(self):
+        return self.now
+
+def test_rate_limit_and_eviction(node, monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(cli_flask, 'time', clock)
+    app = cli_flask.build_app(node, None, rate_limit = 1, rate_burst = 2)
+    limiters = next(c.cell_contents for c in app.before_request_funcs[None][0].__closure__
+                    if isinstance(c.cell_contents, dict))
+    client = app.test_client()
+    codes = [client.post('/get-status', json = {}, 
+                         environ_base = {'REMOTE_ADDR': '10.0.0.1'}).status_code
+             for _ in range(3)]
+    assert codes == [200, 200, 429]
+    # another client has its own limit
+    assert client.post('/get-status', json = {},
+                       environ_base = {'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+    assert set(limiters) == {'10.0.0.1', '10.0.0.2'}
+    # idle clients are dropped at the next sweep
+    clock.now += 61
+    client.post('/get-status', json = {}, environ_base = {'REMOTE_ADDR': '10.0.0.3'})
+    assert set(limiters) == {'10.0.0.3'}
@@ -0,0 +1,82 @@
+"""Two-level topology: fake nodes -> relay -> main node"""
+import time
+from datetime import datetime
+
+import pytest
+
+from next_cluster.main.main_daemon import Cluster
+from next_cluster.main.relay_flask import RelayCluster, build_app
+
+class FakeNodes:
+    """Node backend. Nodes in `down` do not respond."""
+    def __init__(self, make_node):
+        self.make_node = make_node
+        self.down = set()
+
+    def fetch_node(self, host_d, port, passwd):
+        host = host_d['nickname']
+        if host in self.down:
+            raise ConnectionError(host)
+        return self.make_node(host, ['alice'])
+
+class RelayBackend:
+    """Main node backend that polls the relay app"""
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def fetch_node(self, host_d, port, passwd):
+        return self.client.post('/get-status', json = {'passwd': passwd}).get_json()
+
+@pytest.fixture
+def nodes(make_node):
+    return FakeNodes(make_node)
+
+@pytest.fixture
+def build(user_list, nodes):
+    """Return a function to build the relay and the main node. Both are stopped after the test."""
+    clusters = []
+    def build(node_expire_time = 60):
+        relay = RelayCluster([{'nickname': f'node{i}', 'ip': ''} for i in range(3)],
+                             name = 'rack', passwd = 'pw', user_list = user_list,
+                             node_wait = 0.05, node_expire_time = node_expire_time,
+                             adaptive_poll = False, backend = nodes)
+        main = Cluster([{'nickname': 'rack', 'ip': '', 'relay': True}],
+                       passwd = 'pw', add_calendar = False, user_list = user_list,
+                       node_wait = 0.05, dur_book_update = 0.05, adaptive_poll = False,
+                       backend = RelayBackend(build_app(relay, 'pw')))
+        clusters.extend([main, relay])
+        return relay, main
+    yield build
+    for cluster in clusters:
+        cluster.stop()
+
+def test_staleness(build):
+    relay, main = build()
+    time.sleep(1)
+    status = main.get_status()
+    assert [n['hostname'] for n in status['Nodes']] == ['node0', 'node1', 'node2']
+    now = datetime.now()
+    for node in status['Nodes']:
+        assert node['status']
+        # one poll of the node by the relay, one poll of the relay and one check tick
+        staleness = (now - datetime.fromisoformat(node['last_update'])).total_seconds()
+        assert staleness < 0.5
+        # alice has no booking
+        assert node['gpus'][0]['users'][0]['user_code'] == 1
+
+def test_node_down_behind_relay(build, nodes):
+    relay, main = build(node_expire_time = 0.2)
+    time.sleep(0.3)
+    nodes.down.add('node1')
+    time.sleep(0.8)
+    status = main.get_status()
+    by_host = {n['hostname']: n for n in status['Nodes']}
+    assert not by_host['node1']['status']
+    assert by_host['node0']['status']
+    # processes of the node marked down by the relay still get user code
+    assert by_host['node1']['gpus'][0]['users'][0]['user_code'] == 1
+    assert status['illegal_users'] == ['alice']
+    # the check thread is alive and the lock is free
+    assert main.check_thread.is_alive()
+    assert main.lock.acquire(timeout = 1)
+    main.lock.release()
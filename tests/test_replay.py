@@ -0,0 +1,110 @@
+"""Offline replay follows the recorded time and the recorded user list"""
+import sys
+import json
+import subprocess
+
+import pytest
+
+from next_cluster.main.main_daemon import Cluster
+from next_cluster.main.replay import replay
+from next_cluster.utils.traffic import RecordBackend, read_records
+
+T0 = 1700000000. # long before the test runs
+
+def write(path, records):
+    with open(path, 'w') as f:
+        for t, kind, key, data in records:
+            f.write(json.dumps({'t': t, 'kind': kind, 'key': key, 'data': data}) + '\n')
+
+def build(user_list):
+    return Cluster([{'nickname': 'h1', 'ip': ''}], add_calendar = False,
+                   user_list = user_list, node_expire_time = 60, dur_book_update = 5,
+                   adaptive_poll = False, run_daemon = False)
+
+@pytest.mark.parametrize('down_for, status', [(30, True), (90, False)])
+def test_expiry_follows_recorded_time(tmp_path, user_list, make_node, down_for, status):
+    path = tmp_path / 'traffic.jsonl'
+    write(path, [(T0, 'node', 'h1', make_node('h1', ['ann'], T0)),
+                 (T0 + down_for, 'node', 'h1', None)])
+    cluster = build(user_list)
+    replay(str(path), cluster)
+    assert cluster.nodes['h1']['status'] == status
+
+def test_short_recording(tmp_path, user_list, make_node):
+    path = tmp_path / 'traffic.jsonl'
+    write(path, [(T0, 'node', 'h1', make_node('h1', ['ann'], T0)),
+                 (T0 + 4.9, 'node', 'h1', make_node('h1', ['ann'], T0 + 4.9))])
+    cluster = build(user_list)
+    stats = replay(str(path), cluster)
+    assert stats['recorded_seconds'] == pytest.approx(4.9)
+    # a final refresh with the records after the last one
+    assert stats['update_status']['count'] == 1
+    last = make_node('h1', ['ann'], T0 + 4.9)['last_update']
+    assert cluster.get_status()['Nodes'][0]['last_update'] == last
+
+def test_recorded_users(tmp_path, user_list, make_node):
+    path = tmp_path / 'traffic.jsonl'
+    write(path, [(T0, 'users', '', ['ann']),
+                 (T0, 'node', 'h1', make_node('h1', ['ann'], T0)),
+                 (T0 + 10, 'node', 'h1', make_node('h1', ['ann'], T0 + 10))])
+    cluster = build(user_list)
+    replay(str(path), cluster)
+    assert cluster._linux_users == ['ann']
+    assert cluster.bookings.users == {'ann'}
+
+    # --user_list keeps the users of the cluster
+    cluster = build(user_list)
+    replay(str(path), cluster, recorded_users = False)
+    assert cluster._linux_users == open(user_list).read().split()
+
+def test_record_users(tmp_path, user_list):
+    path = tmp_path / 'traffic.jsonl'
+    backend = RecordBackend(str(path))
+    Cluster([], add_calendar = False, user_list = user_list, 
+            backend = backend, run_daemon = False)
+    backend._file.close()
+    records = list(read_records(str(path)))
+    assert [(r['kind'], r['data']) for r in records] == [('users', open(user_list).read().split())]
+
+RECORDER = '''
+import os, sys, json, gzip
+from next_cluster.utils.traffic import RecordBackend
+path, t, mode = sys.argv[1], float(sys.argv[2]), sys.argv[3]
+records = [(t, json.loads(sys.argv[4])), (t + 10, json.loads(sys.argv[5]))]
+if mode == 'append':
+    # the recorder before a new file per run
+    f = gzip.open(path, 'at', encoding = 'utf-8')
+    for t, data in records:
+        f.write(json.dumps({'t': t, 'kind': 'node', 'key': 'h1', 'data': data}) + '\\n')
+        f.flush()
+else:
+    backend = RecordBackend(path)
+    for t, data in records:
+        backend.write('node', 'h1', data)
+os._exit(0) # killed without closing the file
+'''
+
+def record_and_kill(path, t, make_node, mode = 'new'):
+    subprocess.run([sys.executable, '-c', RECORDER, str(path), str(t), mode,
+                    json.dumps(make_node('h1', ['ann'], t)),
+                    json.dumps(make_node('h1', ['ann'], t + 10))],
+                   check = True, capture_output = True)
+
+def test_replay_after_killed_recorder(tmp_path, user_list, make_node):
+    path = tmp_path / 'traffic.jsonl.gz'
+    record_and_kill(path, T0, make_node)
+    record_and_kill(path, T0 + 100, make_node)
+    files = sorted(tmp_path.glob('traffic*.jsonl.gz'))
+    assert len(files) == 2
+    records = [rec for f in files for rec in read_records(str(f))]
+    assert len(records) == 4
+    # newest file first, replayed in the order of records
+    stats = replay([str(f) for f in reversed(files)], build(user_list))
+    assert stats['records'] == 4
+
+def test_read_appended_gzip_streams(tmp_path, make_node):
+    path = tmp_path / 'traffic.jsonl.gz'
+    record_and_kill(path, T0, make_node, 'append')
+    record_and_kill(path, T0 + 100, make_node, 'append')
+    # records after the unfinished stream are lost, but reading does not fail
+    assert [rec['data']['hostname'] for rec in read_records(str(path))] == ['h1', 'h1']
@@ -0,0 +1,97 @@
+"""Calendar fetching against a local fake Teamup that enforces a rate limit"""
+import time
+import json
+import threading
+from collections import deque
+
+import pytest
+import requests
+from flask import Flask, Response
+from werkzeug.serving import make_server
+
+from next_cluster.utils import teamup
+from next_cluster.main.main_daemon import Cluster
+
+class FakeTeamup:
+    """Reject requests beyond `limit` per second with 429"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.times = deque()
+        self.ok = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+        app = Flask(__name__)
+        app.before_request(self.check_rate)
+        app.add_url_rule('/<cal_id>', view_func = self.page)
+        app.add_url_rule('/<cal_id>/events', view_func = self.events)
+        self.server = make_server('127.0.0.1', 0, app, threaded = True)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+
+    def check_rate(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.times and now - self.times[0] >= 1:
+                self.times.popleft()
+            if len(self.times) >= self.limit:
+                self.throttled += 1
+                return Response('Too Many Requests', 429, {'Retry-After': '1'})
+            self.times.append(now)
+            self.ok += 1
+
+    def page(self, cal_id):
+        calendars = [{'id': 1, 'name': 'ASUS 1 > GPU 0'}, {'id': 2, 'name': 'DGX1 2 > GPU 7'}]
+        return f'<html><script>var calendars = {json.dumps(calendars)};</script></html>'
+
+    def events(self, cal_id):
+        return {'events': [{'subcalendar_ids': [1, 2], 'title': cal_id, 'who': 'bob',
+                            'start_dt': '2024-01-01T09:00:00+08:00',
+                            'end_dt': '2024-01-02T18:00:00+08:00'}]}
+
+@pytest.fixture
+def fake_teamup(monkeypatch):
+    server = FakeTeamup(limit = 3)
+    monkeypatch.setattr(teamup, 'TEAMUP_URL', server.url)
+    yield server
+    server.server.shutdown()
+
+def test_server_enforces_limit(fake_teamup):
+    with pytest.raises(requests.HTTPError) as e:
+        for _ in range(5):
+            teamup.get_calendar_id('cal')
+    assert e.value.response.status_code == 429
+
+def test_get_gpu_bookings(fake_teamup):
+    start = teamup.local_today()
+    bookings = teamup.get_gpu_bookings('cal', start, start, teamup.translate_next)
+    assert [(bk.title, bk.who, bk.hostname, bk.index) for bk in bookings] == \
+           [('cal', 'bob', 'next-asus-01', 0), ('cal', 'bob', 'next-dgx1-02', 7)]
+    assert bookings[0].end - bookings[0].start == teamup.datetime.timedelta(days = 2)
+
+@pytest.fixture
+def calendar_cluster(fake_teamup, user_list):
+    # at most 1 + 2 requests in any second, within the server limit
+    cluster = Cluster([], teamup_ids = ['c1', 'c2', 'c3'], num_days = 3,
+                      user_list = user_list, cal_wait = 0.1, dur_book_update = 0.1,
+                      teamup_rate = 2, teamup_burst = 1)
+    yield cluster
+    # before the server shuts down
+    cluster.stop()
+
+def test_calendar_threads_share_limit(fake_teamup, calendar_cluster):
+    cluster = calendar_cluster
+    deadline = time.time() + 10
+    while len(cluster.calendar_fresh) < 3 and time.time() < deadline:
+        time.sleep(0.1)
+    assert set(cluster.calendar_fresh) == {'c1', 'c2', 'c3'}
+    time.sleep(1)
+    assert fake_teamup.throttled == 0
+    assert set(cluster.bookings.bookings()) == {'c1', 'c2', 'c3'}
+    assert cluster.calendar_status
+
+def test_no_teamup_ids(user_list):
+    cluster = Cluster([], add_calendar = False, teamup_ids = None, user_list = user_list,
+                      run_daemon = False)
+    status = cluster.get_status()
+    assert status['teamup_ids'] == []
+    assert not status['calendar_status']
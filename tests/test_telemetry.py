@@ -0,0 +1,170 @@
+"""GPUTelemetry and NodeStat telemetry with a fake NVML module"""
+import pytest
+
+from next_cluster.utils import gpu_status
+from next_cluster.utils.gpu_status import GPUTelemetry
+from next_cluster.utils.records import GPU_STAT
+
+class NVMLError(Exception):
+    pass
+
+class NVMLError_NotSupported(NVMLError):
+    pass
+
+class NVMLError_NotFound(NVMLError):
+    pass
+
+class Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class FakeNVML:
+    """Two gpus. Gpu 1 does not support memory clock."""
+    NVMLError = NVMLError
+    NVMLError_NotSupported = NVMLError_NotSupported
+    NVMLError_NotFound = NVMLError_NotFound
+    NVML_CLOCK_SM = 1
+    NVML_CLOCK_MEM = 2
+    NVML_PCIE_UTIL_TX_BYTES = 0
+    NVML_PCIE_UTIL_RX_BYTES = 1
+    NVML_MEMORY_ERROR_TYPE_UNCORRECTED = 1
+    NVML_VOLATILE_ECC = 0
+    NVML_FI_DEV_POWER_INSTANT = 186
+    NVML_FI_DEV_ECC_DBE_VOL_TOTAL = 3
+
+    def __init__(self, field_values = True):
+        self.calls = []
+        self.ts = 100
+        if field_values:
+            self.nvmlDeviceGetFieldValues = self._field_values
+
+    def nvmlInit(self):
+        pass
+
+    def nvmlShutdown(self):
+        pass
+
+    def nvmlDeviceGetCount(self):
+        return 2
+
+    def nvmlDeviceGetHandleByIndex(self, i):
+        return i
+
+    def nvmlDeviceGetSerial(self, h):
+        return f'serial{h}'
+
+    def nvmlDeviceGetName(self, h):
+        return b'RTX'
+
+    def nvmlDeviceGetMemoryInfo(self, h):
+        return Obj(used = 2 ** 30, total = 2 ** 34)
+
+    def nvmlDeviceGetUtilizationRates(self, h):
+        return Obj(gpu = 50)
+
+    def nvmlDeviceGetTemperature(self, h, sensor):
+        return 60
+
+    def _field_values(self, h, ids):
+        self.calls.append(('field_values', h, tuple(ids)))
+        values = {186: 250000, 3: 2}
+        return [Obj(nvmlReturn = 0, valueType = 1, value = Obj(uiVal = values[i]))
+                for i in ids]
+
+    def nvmlDeviceGetPowerUsage(self, h):
+        self.calls.append(('power', h))
+        return 125000
+
+    def nvmlDeviceGetTotalEccErrors(self, h, error_type, counter_type):
+        self.calls.append(('ecc', h))
+        return 1
+
+    def nvmlDeviceGetClockInfo(self, h, clock):
+        self.calls.append(('clock', h, clock))
+        if h == 1 and clock == self.NVML_CLOCK_MEM:
+            raise NVMLError_NotSupported()
+        return 1500 if clock == self.NVML_CLOCK_SM else 9000
+
+    def nvmlDeviceGetProcessUtilization(self, h, last_ts):
+        self.calls.append(('proc_util', h, last_ts))
+        if last_ts >= self.ts:
+            raise NVMLError_NotFound()
+        return [Obj(pid = 42, smUtil = 77, timeStamp = self.ts)]
+
+@pytest.fixture
+def nvml(monkeypatch):
+    fake = FakeNVML()
+    monkeypatch.setattr(gpu_status, 'N', fake)
+    return fake
+
+def test_batched_field_values(nvml):
+    t = GPUTelemetry({'power': 1, 'ecc_errors': 1})
+    values = t.collect()
+    assert values == {0: {'power': 250.0, 'ecc_errors': 2},
+                      1: {'power': 250.0, 'ecc_errors': 2}}
+    # one batched query per gpu, no single-field calls
+    assert nvml.calls == [('field_values', 0, (186, 3)), ('field_values', 1, (186, 3))]
+
+def test_fallback_without_field_values(monkeypatch):
+    fake = FakeNVML(field_values = False)
+    monkeypatch.setattr(gpu_status, 'N', fake)
+    values = GPUTelemetry({'power': 1, 'ecc_errors': 1}).collect()
+    assert values[0] == {'power': 125.0, 'ecc_errors': 1}
+    assert ('power', 0) in fake.calls and ('ecc', 1) in fake.calls
+
+def test_fallback_on_field_value_error(nvml):
+    def fail(h, ids):
+        raise NVMLError()
+    nvml.nvmlDeviceGetFieldValues = fail
+    values = GPUTelemetry({'power': 1}).collect()
+    assert values[1] == {'power': 125.0}
+
+def test_fallback_on_unknown_value_type(nvml):
+    def field_values(h, ids):
+        return [Obj(nvmlReturn = 0, valueType = 99, value = Obj()) for i in ids]
+    nvml.nvmlDeviceGetFieldValues = field_values
+    values = GPUTelemetry({'power': 1, 'ecc_errors': 1}).collect()
+    assert values[0] == {'power': 125.0, 'ecc_errors': 1}
+
+def test_not_supported_is_skipped(nvml):
+    t = GPUTelemetry({'mem_clock': 0})
+    assert t.collect() == {0: {'mem_clock': 9000}, 1: {'mem_clock': None}}
+    nvml.calls.clear()
+    assert t.collect() == {0: {'mem_clock': 9000}, 1: {'mem_clock': None}}
+    assert nvml.calls == [('clock', 0, FakeNVML.NVML_CLOCK_MEM)]
+
+def test_field_intervals(nvml):
+    t = GPUTelemetry({'sm_clock': 0, 'ecc_errors': 1000})
+    assert t.interval == 0
+    t.collect()
+    nvml.calls.clear()
+    values = t.collect()
+    # ecc errors are not due and keep the last value
+    assert values[0] == {'sm_clock': 1500, 'ecc_errors': 2}
+    assert all(c[0] == 'clock' for c in nvml.calls)
+
+def test_proc_util_timestamp(nvml):
+    t = GPUTelemetry({'proc_util': 0})
+    assert t.collect()[0] == {'proc_util': {42: 77}}
+    assert ('proc_util', 0, 0) in nvml.calls
+    # no new samples since the last timestamp
+    assert t.collect()[0] == {'proc_util': {}}
+    assert ('proc_util', 0, 100) in nvml.calls
+
+def test_unknown_field(nvml):
+    with pytest.raises(ValueError):
+        GPUTelemetry({'fan': 1})
+
+def test_node_status_round_trip(nvml, monkeypatch):
+    from next_cluster.client import client_daemon
+    from next_cluster.utils.records import GPU_PROC
+    node = client_daemon.NodeStat(extra_keys = [], telemetry = {'power': 1, 'proc_util': 1})
+    node._set_gpus(gpu_status.get_gpu_stat())
+    node._set_procs({0: [GPU_PROC(42, 'ann', 100, 'python')]})
+    node._set_telemetry(node.telemetry.collect())
+    gpu = node.status['gpus'][0]
+    assert gpu['power'] == 250.0
+    assert 'proc_util' not in gpu
+    assert gpu['users'][0]['util'] == 77
+    # the main node keeps telemetry when it converts fetched gpus to records
+    assert GPU_STAT.from_dict(gpu).to_dict() == gpu
@@ -0,0 +1,55 @@
+"""Exact matching of process owners against today's bookings"""
+import datetime
+
+import pytest
+
+from next_cluster.utils.teamup import Booking, split_who, local_today
+from next_cluster.main.main_daemon import Cluster
+
+@pytest.mark.parametrize('who, users', [
+    ('cat, dog', ['cat', 'dog']),
+    ('cat，dog', ['cat', 'dog']),
+    ('cat dog', ['cat', 'dog']),
+    ('cat;dog; fox', ['cat', 'dog', 'fox']),
+    ('cat；dog、fox', ['cat', 'dog', 'fox']),
+    ('  cat  ,, dog ', ['cat', 'dog']),
+    ('', []),
+    (None, []),
+])
+def test_split_who(who, users):
+    assert split_who(who) == users
+
+@pytest.fixture
+def cluster(user_list):
+    return Cluster([{'nickname': 'h1', 'ip': ''}, {'nickname': 'h2', 'ip': ''}],
+                   add_calendar = False, user_list = user_list, run_daemon = False)
+
+def codes(cluster, host):
+    cluster.update_status()
+    node = next(n for n in cluster.get_status()['Nodes'] if n['hostname'] == host)
+    return {p['username']: p['user_code'] for p in node['gpus'][0]['users']}
+
+def test_substring_usernames(cluster, make_node):
+    today = local_today().date()
+    tomorrow = today + datetime.timedelta(days = 1)
+    cluster.apply_bookings('cal', [Booking('anna', 'bob', 'h1', 0, today, tomorrow)])
+    cluster.apply_node_data({'nickname': 'h1'}, make_node('h1', ['anna', 'ann', 'bob', 'bo']))
+    # ann is a substring of anna and bo of bob, but neither booked the gpu
+    assert codes(cluster, 'h1') == {'anna': 0, 'ann': 1, 'bob': 0, 'bo': 1}
+
+def test_who_separators(cluster, make_node):
+    today = local_today().date()
+    tomorrow = today + datetime.timedelta(days = 1)
+    cluster.apply_bookings('cal', [Booking('ann', 'alice bob', 'h1', 0, today, tomorrow)])
+    cluster.apply_node_data({'nickname': 'h1'}, make_node('h1', ['ann', 'alice', 'bob', 'anna']))
+    assert codes(cluster, 'h1') == {'ann': 0, 'alice': 0, 'bob': 0, 'anna': 1}
+
+def test_booking_on_other_gpu_or_day(cluster, make_node):
+    today = local_today().date()
+    cluster.apply_bookings('cal', [
+        Booking('ann', '', 'h2', 0, today, today + datetime.timedelta(days = 1)),
+        Booking('bob', '', 'h1', 0, today + datetime.timedelta(days = 1),
+                today + datetime.timedelta(days = 2))])
+    cluster.apply_node_data({'nickname': 'h1'}, make_node('h1', ['ann', 'bob']))
+    assert codes(cluster, 'h1') == {'ann': 1, 'bob': 1}
+    assert sorted(cluster.get_status()['illegal_users']) == ['ann', 'bob']
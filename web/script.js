@@ -15,6 +15,9 @@ $(document).ready(function(){
 
     // listen scroll to make nav bar at top.
     window.addEventListener('scroll', onScroll);
+    // only nodes near the window are rendered
+    window.addEventListener('scroll', schedule_visible);
+    window.addEventListener('resize', schedule_visible);
 })
 
 function remove_blank(oEelement){
@@ -37,99 +40,290 @@ function get_data(){
     })
 }
 
+// rendered views of nodes keyed by hostname. Each view is
+//     slot: the placeholder of the node in #content-status
+//     node: the rendered node line, null if the node is out of the window
+//     data: the latest node data
+//     cells: last rendered value of each cell, to only patch changed cells
+//     gpus: views of gpu lines keyed by gpu index, {line, cells}
+var node_views = {};
+var node_order = [];
+var show_calendar = false;
+var head_dates = '';
+// nodes within this distance (pixels) to the window are rendered
+var render_margin = 800;
+
 function create_page(data){
     // teamup link
     // $("#teamup_link").attr('href', "https://teamup.com/" + data.teamup_id);
 
-    // add the calendar date in the head line
     cluster_data = data;
-    if (data.calendar_status){
+    // show bookings loaded from cache until the calendar is refreshed
+    var show = Boolean(data.calendar_status || data.calendar_stale);
+    // add the calendar date in the head line
+    if (show && data.date_list.join(',') != head_dates){
+        head_dates = data.date_list.join(',');
         var schedule = $("#head-line .colum.schedule")
         schedule.empty()
         for (var i=0;i<data.date_list.length; i++) {
             schedule.append($("<div></div>").addClass("head colum schedule-day sample").text(data.date_list[i]))
         }
     }
-    
-    var content = $("#content-status").empty();
-    for (var i=0; i<data.Nodes.length; i++) {
-        var n_data = data.Nodes[i];
-        var node = $("#content-status-sample .node-line").clone();
-        // node information
-        node.find(".node-name").text(n_data.hostname);
-        node.find(".node-status").attr("data-status", n_data.status);
-        node.find('.node-version').text(n_data.version);
-        if (n_data.ips) {
-            ips = n_data.ips;
-            var ip_str = '';
-            for (j = 0; j< ips.length; j++) {
-                ip_str = ip_str + ips[j][1] + '(' + ips[j][0] + ')&nbsp;&nbsp;&nbsp;&nbsp;';
-            }
-            node.find('.node-ip').html(ip_str);
-        }
-
-        // fill gpu status
-        var gpu_area = node.find(".gpu-list").empty();
-        for (j=0; j<n_data.gpus.length; j++) {
-            var gpu_data = n_data.gpus[j];
-            var gpu_line = $("<div></div>").addClass("gpu-line");
-            gpu_line.append($("<div></div>").addClass("colum gpu-idx").text(gpu_data.index))
-            //memory
-            gpu_line.append($("<div></div>").addClass("colum memory").text(gpu_data.use_mem + "/" + gpu_data.tot_mem));
-            var mem_per = gpu_data.use_mem / gpu_data.tot_mem * 100;
-            // console.log(gpu_line.find(".colum.memory"));
-            gpu_line.find(".colum.memory").css("background", `linear-gradient(to right, #99CC66 ${mem_per}%, white ${mem_per}%, white)`);
-            gpu_line.append($("<div></div>").addClass("colum utilize").text(gpu_data.utilize + " %"));
-            // add current user information
-            // update 2011.11.1
-            //gpu_line.append($("<div></div>").addClass("colum users").text(gpu_data.users.map(x => x[0]).join(" ")));
-            gpu_line.append($("<div></div>").addClass("colum users").text(' '));
-            if (gpu_data.users.length==0) {
-                gpu_line.find(".colum.users").html("&nbsp;")
-            }
-            
-            else {
-                html_str = ''
-                for (ui=0; ui<gpu_data.users.length; ui++){
-                    var u_info = gpu_data.users[ui];
-                    if (u_info.user_code==0) { // legal user
-                        html_str = html_str + u_info.username + " "
-                    }
-                    else { // illegal user
-                        html_str = html_str + "<span class='illegal_user'>" + u_info.username + "</span>" + " "
-                    }
-                }
-                gpu_line.find(".colum.users").html('<div>' + html_str + '</div>')
+    if (show != show_calendar) {
+        // gpu lines have a different set of columns
+        show_calendar = show;
+        for (var host in node_views) {
+            reset_gpus(node_views[host]);
+        }
+    }
+
+    render_nodes(data.Nodes);
+    add_warning(data);
+}
+
+function render_nodes(nodes){
+    var content = $("#content-status");
+    var order = [];
+    var seen = {};
+    for (var i=0; i<nodes.length; i++) {
+        var n_data = nodes[i];
+        var host = n_data.hostname || String(i);
+        var view = node_views[host];
+        if (!view) {
+            view = {slot: $("<div></div>").addClass("node-slot"), node: null, 
+                    data: null, cells: {}, gpus: {}, height: null};
+            node_views[host] = view;
+        }
+        view.data = n_data;
+        view.dirty = true;
+        if (!view.node) {
+            set_slot_height(view);
+        }
+        order.push(host);
+        seen[host] = true;
+    }
+    for (var host in node_views) {
+        if (!seen[host]) {
+            node_views[host].slot.remove();
+            delete node_views[host];
+        }
+    }
+    if (order.join('\n') != node_order.join('\n')) {
+        // append moves existing slots into the new order
+        for (var i=0; i<order.length; i++) {
+            content.append(node_views[order[i]].slot);
+        }
+    }
+    node_order = order;
+    update_visible();
+}
+
+function node_height(view){
+    // measured height, or estimated from the number of gpus before the first render
+    if (view.height) {
+        return view.height;
+    }
+    return 40 + view.data.gpus.length * 32;
+}
+
+var visible_pending = false;
+function schedule_visible(){
+    if (!visible_pending) {
+        visible_pending = true;
+        window.requestAnimationFrame(function(){
+            visible_pending = false;
+            update_visible();
+        });
+    }
+}
+
+function update_visible(){
+    // read all positions before changing the DOM to avoid repeated layout
+    var top = -render_margin;
+    var bottom = window.innerHeight + render_margin;
+    var visible = [];
+    for (var i=0; i<node_order.length; i++) {
+        var view = node_views[node_order[i]];
+        var rect = view.slot[0].getBoundingClientRect();
+        if (view.node) {
+            view.height = rect.height;
+        }
+        visible.push(rect.bottom >= top && rect.top <= bottom);
+    }
+    for (var i=0; i<node_order.length; i++) {
+        var view = node_views[node_order[i]];
+        if (visible[i]) {
+            if (!view.node) {
+                mount_node(view);
             }
-            
-            // add calendar
-            if (data.calendar_status & "calendar" in gpu_data) {
-                var calendar = $("<div></div>").addClass("colum schedule");
-                gpu_line.append(calendar);
-                gpu_data.calendar.map(
-                    x => calendar.append(
-                    $("<div></div>")
-                    .addClass("colum schedule-day")
-                    .html(
-                        x.length > 0 ?x.map(ele => get_one_booking_html(ele)).join("<br>"): "&nbsp;")
-                    ));
+            if (view.dirty) {
+                patch_node(view);
             }
-            // update 2022.7.25
-            var wrap_line = $("<div></div>");
-            wrap_line.append(gpu_line);
-            gpu_area.append(wrap_line);
         }
+        else if (view.node) {
+            unmount_node(view);
+        }
+    }
+}
 
-        content.append(node);
+function mount_node(view){
+    view.node = $("#content-status-sample .node-line").clone();
+    view.node.find(".gpu-list").empty();
+    view.cells = {};
+    view.gpus = {};
+    view.slot_height = "";
+    view.slot.css("height", "").append(view.node);
+}
+
+function unmount_node(view){
+    view.node.remove();
+    view.node = null;
+    set_slot_height(view);
+}
 
+function set_slot_height(view){
+    // keep the space of the node when it is not rendered
+    var height = node_height(view) + "px";
+    if (view.slot_height != height) {
+        view.slot_height = height;
+        view.slot.css("height", height);
     }
-    add_warning(data);
+}
+
+function reset_gpus(view){
+    if (view.node) {
+        view.node.find(".gpu-list").empty();
+    }
+    view.gpus = {};
+    view.dirty = true;
+}
+
+// call apply(value) only if the value of the cell changes
+function patch(cells, key, value, apply){
+    if (cells[key] !== value) {
+        cells[key] = value;
+        apply(value);
+    }
+}
+
+function patch_node(view){
+    var n_data = view.data;
+    var node = view.node;
+    var cells = view.cells;
+    view.dirty = false;
+
+    // node information
+    patch(cells, "name", n_data.hostname, v => node.find(".node-name").text(v));
+    patch(cells, "status", n_data.status, v => node.find(".node-status").attr("data-status", v));
+    patch(cells, "version", n_data.version, v => node.find('.node-version').text(v));
+    if (n_data.ips) {
+        var ips = n_data.ips;
+        var ip_str = '';
+        for (var j = 0; j< ips.length; j++) {
+            ip_str = ip_str + ips[j][1] + '(' + ips[j][0] + ')&nbsp;&nbsp;&nbsp;&nbsp;';
+        }
+        patch(cells, "ip", ip_str, v => node.find('.node-ip').html(v));
+    }
+
+    // fill gpu status
+    var gpu_area = node.find(".gpu-list");
+    var seen = {};
+    var order_changed = false;
+    for (var j=0; j<n_data.gpus.length; j++) {
+        var gpu_data = n_data.gpus[j];
+        seen[gpu_data.index] = true;
+        var gpu = view.gpus[gpu_data.index];
+        if (!gpu) {
+            gpu = {line: new_gpu_line(), cells: {}};
+            view.gpus[gpu_data.index] = gpu;
+            order_changed = true;
+        }
+        patch_gpu(gpu, gpu_data);
+    }
+    for (var index in view.gpus) {
+        if (!seen[index]) {
+            view.gpus[index].line.remove();
+            delete view.gpus[index];
+        }
+    }
+    if (order_changed) {
+        for (var j=0; j<n_data.gpus.length; j++) {
+            gpu_area.append(view.gpus[n_data.gpus[j].index].line);
+        }
+    }
+}
+
+function new_gpu_line(){
+    var gpu_line = $("<div></div>").addClass("gpu-line");
+    gpu_line.append($("<div></div>").addClass("colum gpu-idx"));
+    gpu_line.append($("<div></div>").addClass("colum memory"));
+    gpu_line.append($("<div></div>").addClass("colum utilize"));
+    gpu_line.append($("<div></div>").addClass("colum users"));
+    // update 2022.7.25
+    var wrap_line = $("<div></div>");
+    wrap_line.append(gpu_line);
+    return wrap_line;
+}
+
+function patch_gpu(gpu, gpu_data){
+    var line = gpu.line;
+    var cells = gpu.cells;
+    patch(cells, "index", gpu_data.index, v => line.find(".colum.gpu-idx").text(v));
+    //memory
+    patch(cells, "memory", gpu_data.use_mem + "/" + gpu_data.tot_mem, function(v){
+        var mem_per = gpu_data.use_mem / gpu_data.tot_mem * 100;
+        line.find(".colum.memory").text(v)
+            .css("background", `linear-gradient(to right, #99CC66 ${mem_per}%, white ${mem_per}%, white)`);
+    });
+    patch(cells, "utilize", gpu_data.utilize + " %", v => line.find(".colum.utilize").text(v));
+    // add current user information
+    patch(cells, "users", get_users_html(gpu_data.users), v => line.find(".colum.users").html(v));
+
+    // add calendar
+    if (show_calendar && "calendar" in gpu_data) {
+        var calendar = line.find(".colum.schedule");
+        if (calendar.length == 0) {
+            calendar = $("<div></div>").addClass("colum schedule");
+            line.find(".gpu-line").append(calendar);
+        }
+        var days = calendar.children();
+        if (days.length != gpu_data.calendar.length) {
+            calendar.empty();
+            for (var d=0; d<gpu_data.calendar.length; d++) {
+                calendar.append($("<div></div>").addClass("colum schedule-day"));
+                delete cells["day" + d];
+            }
+            days = calendar.children();
+        }
+        for (var d=0; d<gpu_data.calendar.length; d++) {
+            var x = gpu_data.calendar[d];
+            var day_html = x.length > 0 ?x.map(ele => get_one_booking_html(ele)).join("<br>"): "&nbsp;";
+            patch(cells, "day" + d, day_html, v => $(days[d]).html(v));
+        }
+    }
+}
+
+function get_users_html(users){
+    if (users.length==0) {
+        return "&nbsp;";
+    }
+    var html_str = '';
+    for (var ui=0; ui<users.length; ui++){
+        var u_info = users[ui];
+        if (u_info.user_code==0) { // legal user
+            html_str = html_str + u_info.username + " "
+        }
+        else { // illegal user
+            html_str = html_str + "<span class='illegal_user'>" + u_info.username + "</span>" + " "
+        }
+    }
+    return '<div>' + html_str + '</div>';
 }
 
 function add_warning(data){
     var warn_div = $("#warning");
     var illegal_user = $("<div></div>");
-    illegal_user.html("<b>Users without booking (marked <span class='illegal_user'>orange</span>): </b>" + "<span class='blue'>" + data.illegal_users.join(" ") + "</span>" + " (by username string match)");
+    illegal_user.html("<b>Users without booking (marked <span class='illegal_user'>orange</span>): </b>" + "<span class='blue'>" + data.illegal_users.join(" ") + "</span>" + " (by exact username match)");
     warn_div.empty().append(illegal_user);
     warn_div.append(
         $("<div></div>").addClass('inline')